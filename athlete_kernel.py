@@ -0,0 +1,117 @@
+'''
+Precompiled physiology and reward constants of an athlete on a training plan.
+RunnerEnv used to rebuild the athlete factors, thresholds, training modifiers and reward mappings at every step;
+AthleteKernel resolves all of them once (they only depend on the athlete, the training type and the plan duration)
+into flat lookup tables, so a step only does arithmetic and indexing.
+It also holds the speed model used to move the runner along the track (speed by power zone, from FTP/kg).
+Tables are indexed by zone (1..5), zone difference (0..4) and action index (slow down, keep going, accelerate);
+phase and slope tables are keyed by their label.
+'''
+
+import math
+
+# Action indexes, same order of runner_env.ACTIONS
+SLOW_DOWN, KEEP_GOING, ACCELERATE = 0, 1, 2
+
+BASE_GAIN = (0.0, 0.01, 0.05, 0.12, 0.3, 0.5)             # fatigue gain by HR zone (1..5)
+ZONE_REWARD = (2.0, 0.5, -1.0, -2.5, -4.0)                # reward by |zone - target zone|
+CAPACITY_PENALTY = (0.0, 0.0, 0.0, 0.5, 1.5, 3.0)         # by HR zone (1..5)
+
+ATHLETE_FACTORS = {
+    #            accumulation, recovery, efficiency, floor
+    "elite":    (0.7, 1.4, 0.8, 0.05),
+    "runner":   (0.9, 1.1, 0.9, 0.1),
+    "amateur":  (1.2, 0.8, 1.1, 0.15),
+}
+FATIGUE_LEVEL_THRESHOLDS = {"elite": (5.5, 8.0), "runner": (4.0, 6.5), "amateur": (2.5, 4.5)}
+FATIGUE_PENALTY_THRESHOLDS = {"elite": (5.0, 7.0), "runner": (4.0, 6.0), "amateur": (3.0, 5.0)}
+EXPECTED_COHERENCE = {"elite": 0.5, "runner": 1.0, "amateur": 1.5}
+TRAINING_MODIFIERS = {"fartlek": 1.3, "interval": 1.2, "progressions": 1.1, "endurance": 1.0, "recovery": 0.7}
+
+# Phase bonus by phase, action and comparison of HR zone with the target (below, on target, above)
+PHASE_BONUS = {
+    "warmup":   ((-1.0, -1.0, -1.0), (0.0, 1.0, 0.0), (0.5, 0.0, 0.0)),
+    "push":     ((0.0, 0.0, 0.5), (0.0, 0.0, 0.0), (1.0, 0.0, 0.0)),
+    "recover":  ((0.0, 0.0, 1.0), (0.0, 0.0, 0.0), (-2.0, -2.0, -2.0)),
+    "cooldown": ((0.0, 0.0, 1.0), (0.0, 0.0, 0.0), (-2.0, -2.0, -2.0)),
+}
+NO_PHASE_BONUS = ((0.0, 0.0, 0.0),) * 3
+RECOVERY_PHASES = ("recover", "cooldown")
+
+# Speed model: each power zone is a fraction of FTP, and running costs about 1.04 J per kg per meter
+ZONE_POWER = (0.0, 0.55, 0.70, 0.85, 0.98, 1.10)         # fraction of FTP by power zone (1..5)
+RUNNING_COST = 1.04                                     # J / (kg m)
+
+# Pacing-coherence with slope, by action
+SLOPE_PENALTY = {
+    "flat":     (0.0, 0.0, 0.0),
+    "uphill":   (0.0, 0.0, -2.0),
+    "downhill": (-0.5, 0.0, 0.0),
+}
+
+
+def athlete_level(athlete):
+    ''' Athlete level based on FTP per kg.'''
+    ftp_per_kg = athlete["FTP"] / athlete["weight_kg"]
+    if ftp_per_kg > 5.5:
+        return "elite"
+    elif ftp_per_kg > 4.0:
+        return "runner"
+    else:
+        return "amateur"
+
+
+class AthleteKernel:
+    def __init__(self, athlete, training_type, duration_s):
+        self.ftp_per_kg = athlete["FTP"] / athlete["weight_kg"]
+        self.level = level = athlete_level(athlete)
+        self.speed_by_zone = tuple(self.ftp_per_kg * f / RUNNING_COST for f in ZONE_POWER)  # m/s by power zone
+        accumulation, recovery, efficiency, self.fatigue_floor = ATHLETE_FACTORS[level]
+
+        # Recovery / cooldown: score * exp(-k) - rate * sigmoid(score)
+        self.recovery_decay = math.exp(-0.05 * recovery)
+        self.recovery_rate = 0.1 * recovery
+
+        # Warmup / push: gain by HR zone (athlete accumulation, push multiplier and efficiency at high zones)
+        gain = [g * accumulation * (efficiency if z >= 4 else 1.0) for z, g in enumerate(BASE_GAIN)]
+        self.warmup_gain = tuple(gain)
+        self.push_gain = tuple(g * 1.2 for g in gain)
+        self.high_zone_penalty = 0.01 * accumulation
+        self.combined_factor = 1 + 0.3 * efficiency
+        self.gain_scale = (min(1.5, max(0.5, 4.0 / self.ftp_per_kg))
+                           * TRAINING_MODIFIERS.get(training_type, 1.0))
+
+        self.medium_threshold, self.high_threshold = FATIGUE_LEVEL_THRESHOLDS[level]
+        self.low_penalty, self.medium_penalty = FATIGUE_PENALTY_THRESHOLDS[level]
+
+        # Reward terms, already weighted
+        self.zone_reward = tuple(0.4 * r for r in ZONE_REWARD)
+        expected = EXPECTED_COHERENCE[level]
+        self.coherence_bonus = tuple(0.3 * (1.0 if d <= expected else -1.0 * (d - expected)) for d in range(5))
+        self.phase_bonus = {phase: tuple(tuple(0.2 * b for b in row) for row in table)
+                            for phase, table in PHASE_BONUS.items()}
+        self.slope_penalty = SLOPE_PENALTY
+        capacity_scale = 1.0 - min(1.0, self.ftp_per_kg / 6.0)
+        self.capacity_adj = tuple(-p * capacity_scale for p in CAPACITY_PENALTY)
+
+        # The funnel tolerance shrinks from 1 to 0 after half of the session
+        self.total_steps = duration_s
+        self.half_session = duration_s * 0.5
+
+    def fatigue_penalty(self, score):
+        if score <= self.low_penalty:
+            return 0.0
+        elif score <= self.medium_penalty:
+            return -1.0 * (score - self.low_penalty)
+        return -2.0 * (score - self.medium_penalty)
+
+
+_KERNEL_CACHE = {}
+
+def compile_kernel(athlete, training_type, duration_s):
+    ''' Cached AthleteKernel: the kernel only depends on FTP/kg, the training type and the session duration.'''
+    key = (athlete["FTP"], athlete["weight_kg"], training_type, duration_s)
+    kernel = _KERNEL_CACHE.get(key)
+    if kernel is None:
+        kernel = _KERNEL_CACHE[key] = AthleteKernel(athlete, training_type, duration_s)
+    return kernel
@@ -0,0 +1,139 @@
+'''
+Headless batch simulator: runs the greedy Q-table policy for every entry of a manifest, without prompts and without
+sleeps, and writes the session logs in the format the visualizer and the render farm read (CSV plus .npz copy, named
+<profile>_<training>_<circuit>.csv). Without a manifest every athlete profile × training × circuit combination is
+simulated once, which regenerates all the logs of render_farm.py.
+
+The manifest is a JSON list of entries; "athlete" is a profile label of data/athletes.json or raw biometrics (matched
+to the nearest profile's Q-table, see utils.get_profile_label), "seeds" (default [0]) runs the entry once per seed:
+
+    [
+      {"athlete": "runner", "training": "fartlek", "circuit": "Belfiore (MN)", "seeds": [0, 1, 2]},
+      {"athlete": {"HR_rest": 55, "HR_max": 182, "FTP": 330, "weight_kg": 72}, "name": "mario",
+       "training": "endurance", "circuit": "Parco acquedotti (Roma)"}
+    ]
+
+Entries are simulated on a process pool; each worker loads a circuit and a compiled policy once for all its entries.
+
+    python batch_sim.py --workers 8
+    python batch_sim.py manifest.json --out simulation_training_logs
+'''
+
+import os
+import json
+import time
+import random
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from runner_env import RunnerEnv, load_json, ACTIONS
+from state_space import encode_state
+from policy import load_or_compile
+from track_store import load_track
+from session_recorder import SessionRecorder
+
+ATHLETES_JSON = "data/athletes.json"
+TRAININGS_JSON = "data/trainings.json"
+MAPS_DIR = "data/maps"
+QTABLES_DIR = "data/q-tables"
+OUT_DIR = "data/training_log_DEF_20062025"  # training_visualizer.CSV_DIR
+
+
+def all_entries():
+    ''' One entry per athlete profile × training × circuit.'''
+    circuits = sorted(os.path.splitext(f)[0] for f in os.listdir(MAPS_DIR) if f.endswith(".json"))
+    return [{"athlete": athlete, "training": training, "circuit": circuit}
+            for athlete in load_json(ATHLETES_JSON) for training in load_json(TRAININGS_JSON) for circuit in circuits]
+
+
+def expand(entries, out_dir):
+    ''' One job per entry and seed, with the athlete resolved to a profile and the path of its log.'''
+    profiles = load_json(ATHLETES_JSON)
+    jobs = []
+    for entry in entries:
+        athlete = entry["athlete"]
+        if isinstance(athlete, str):
+            label, athlete = athlete, profiles[athlete]
+        else:
+            from utils import get_profile_label
+            label = get_profile_label(athlete)
+        seeds = entry.get("seeds", [entry.get("seed", 0)])
+        for seed in seeds:
+            name = f"{entry.get('name', label)}_{entry['training']}_{entry['circuit']}"
+            if len(seeds) > 1:
+                name += f"_seed{seed}"
+            jobs.append({"name": name, "profile_label": label, "athlete": athlete, "training": entry["training"],
+                         "circuit": entry["circuit"], "seed": seed, "log": os.path.join(out_dir, name + ".csv")})
+    return jobs
+
+
+@lru_cache(maxsize=None)
+def _track(circuit):
+    return load_track(circuit)
+
+
+@lru_cache(maxsize=None)
+def _policy(profile_label, training):
+    return load_or_compile(os.path.join(QTABLES_DIR, f"q_{profile_label}_{training}.json"))
+
+
+@lru_cache(maxsize=None)
+def _training(training):
+    return load_json(TRAININGS_JSON)[training]
+
+
+def simulate(job):
+    ''' Run one session with the greedy policy and write its log. Returns (name, steps, total reward, seconds).'''
+    t0 = time.perf_counter()
+    random.seed(job["seed"])
+    track = _track(job["circuit"])
+    policy = _policy(job["profile_label"], job["training"])
+    env = RunnerEnv(job["athlete"], _training(job["training"]), track_data=track, verbose=False)
+    state = env.reset()
+    total, done = 0.0, False
+    with SessionRecorder(job["log"], track=track, columnar="npz", flush_rows=4096, flush_seconds=60) as recorder:
+        while not done:
+            action = ACTIONS[policy.act_index(encode_state(state))]
+            state, reward, done = env.step(action)
+            total += reward
+            recorder.record(state, action, reward, env.fatigue_score, env.track_index)
+    return job["name"], recorder.rows, total, time.perf_counter() - t0
+
+
+def run_batch(entries, out_dir=OUT_DIR, workers=1):
+    ''' Simulate every entry (and seed) of a manifest. Returns {name: (steps, total reward)}.'''
+    jobs = expand(entries, out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    results = {}
+    t0 = time.perf_counter()
+
+    def done(name, steps, total, seconds):
+        results[name] = (steps, total)
+        print(f"✔️ [{len(results)}/{len(jobs)}] {name}: {steps} s, reward {total:.1f} ({seconds:.2f}s)")
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(simulate, job) for job in jobs]):
+                done(*future.result())
+    else:
+        for job in jobs:
+            done(*simulate(job))
+    print(f"✅ {len(jobs)} session logs in {out_dir} in {time.perf_counter() - t0:.1f}s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate sessions with the greedy policies and write their logs")
+    parser.add_argument("manifest", nargs="?",
+                        help="JSON list of entries (default: every profile × training × circuit)")
+    parser.add_argument("--out", default=OUT_DIR, help="directory of the session logs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    args = parser.parse_args()
+
+    if args.manifest:
+        with open(args.manifest) as f:
+            entries = json.load(f)
+    else:
+        entries = all_entries()
+    run_batch(entries, args.out, args.workers)
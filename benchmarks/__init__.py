@@ -0,0 +1 @@
+'''Performance benchmarks of Smart Pacer. Run them from the repository root, e.g. `python -m benchmarks.step_time`.'''
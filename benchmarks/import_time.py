@@ -0,0 +1,84 @@
+'''
+Import-time budget: every module in BUDGETS is imported cold (in a fresh interpreter, `repeat` times, median kept) and
+checked against its time budget, against the heavy dependencies it must not load and for side effects (files or
+folders created under data/ by the import). Exits with status 1 if a check fails, so it can gate a change:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 9 --only utils
+'''
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("numpy", "pandas", "matplotlib", "pyfiglet", "tqdm", "PIL", "paho")
+
+# module -> (budget in ms, modules it must not import)
+BUDGETS = {
+    "runner_env": (30, HEAVY),
+    "utils": (40, HEAVY),
+    "q_learning_trainer": (250, ("pandas", "matplotlib", "pyfiglet", "tqdm", "PIL")),
+}
+
+PROBE = '''
+import sys, json, time
+t0 = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t0
+print(json.dumps({{"ms": seconds * 1000, "modules": sorted({{m.split(".")[0] for m in sys.modules}})}}))
+'''
+
+
+def snapshot(path):
+    return {os.path.join(d, name) for d, dirs, files in os.walk(path) for name in dirs + files}
+
+
+def measure(module, repeat=5):
+    ''' Median cold import time of a module (ms), the top-level modules it loaded and the paths it created.'''
+    data = os.path.join(ROOT, "data")
+    before = snapshot(data)
+    samples, modules = [], set()
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        samples.append(probe["ms"])
+        modules.update(probe["modules"])
+    return {"ms": statistics.median(samples), "samples": samples, "modules": modules,
+            "created": sorted(snapshot(data) - before)}
+
+
+def check(module, repeat=5):
+    ''' (measure, list of failures) of a module against its budget.'''
+    budget, forbidden = BUDGETS[module]
+    result = measure(module, repeat)
+    failures = []
+    if result["ms"] > budget:
+        failures.append(f"{result['ms']:.0f} ms over the {budget} ms budget")
+    loaded = [name for name in forbidden if name in result["modules"]]
+    if loaded:
+        failures.append(f"imports {', '.join(loaded)}")
+    if result["created"]:
+        failures.append(f"creates {', '.join(os.path.relpath(p, ROOT) for p in result['created'])}")
+    return result, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the cold import time and side effects of the modules")
+    parser.add_argument("--only", help="comma-separated modules (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BUDGETS)
+    failed = False
+    print(f"{'module':20} {'import ms':>9} {'budget':>7}")
+    for name in names:
+        result, failures = check(name, args.repeat)
+        status = "✅" if not failures else "❌ " + "; ".join(failures)
+        print(f"{name:20} {result['ms']:9.1f} {BUDGETS[name][0]:7}  {status}")
+        failed |= bool(failures)
+    sys.exit(1 if failed else 0)
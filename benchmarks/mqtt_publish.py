@@ -0,0 +1,130 @@
+'''
+Publishing throughput against a local MQTT broker (local_broker.py, started in-process).
+The same stream of pacing messages (real RunnerEnv states, spread over many athlete topics) is published with:
+
+- legacy: utils.send_mqtt, JSON encoded and published from the caller (with the network loop started);
+- publisher/json and publisher/binary: the non-blocking Publisher with the two payload formats.
+
+For each one it reports the time the caller spends per message, the payload size and the messages per second
+received by a subscriber on smartpacer/+/action.
+
+    python -m benchmarks.mqtt_publish --messages 50000 --qos 0
+'''
+
+import time
+import argparse
+import threading
+import warnings
+
+import paho.mqtt.client as mqtt
+
+from runner_env import RunnerEnv, load_json
+from track_store import load_track
+from local_broker import start_broker
+from publisher import Publisher, encode_binary
+from utils import send_mqtt, mqtt_payload
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def sample_messages(n, athletes):
+    ''' n (topic, state, action, reward) messages from a RunnerEnv episode, round robin over `athletes` topics.'''
+    env = RunnerEnv(load_json("data/athletes.json")["runner"], load_json("data/trainings.json")["fartlek"],
+                    track_data=load_track("Parco acquedotti (Roma)"), verbose=False)
+    state, done, steps = env.reset(), False, []
+    while not done:
+        action = "keep going"
+        state, reward, done = env.step(action)
+        steps.append((state, action, reward))
+    messages = []
+    for i in range(n):
+        state, action, reward = steps[i % len(steps)]
+        state = dict(state, timestamp=i // athletes)
+        messages.append((f"smartpacer/athlete{i % athletes:04d}/action", state, action, reward))
+    return messages
+
+
+class Counter:
+    ''' Subscriber counting the messages received on all the athlete topics.'''
+
+    def __init__(self, host, port):
+        self.count = 0
+        self.ready = threading.Event()
+        self.client = mqtt.Client()
+        self.client.on_connect = lambda c, u, f, rc: c.subscribe("smartpacer/+/action")
+        self.client.on_subscribe = lambda *args: self.ready.set()
+        self.client.on_message = self._on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        self.ready.wait(5)
+
+    def _on_message(self, client, userdata, msg):
+        self.count += 1
+
+    def wait(self, expected, timeout=30.0):
+        ''' Wait until `expected` messages arrived or no message arrived for a second.'''
+        deadline, last, last_change = time.perf_counter() + timeout, -1, time.perf_counter()
+        while self.count < expected and time.perf_counter() < deadline:
+            if self.count != last:
+                last, last_change = self.count, time.perf_counter()
+            elif time.perf_counter() - last_change > 1.0:
+                break
+            time.sleep(0.005)
+        return time.perf_counter()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def run_legacy(host, port, messages, qos):
+    client = mqtt.Client()
+    client.connect(host, port, 60)
+    client.loop_start()
+    t0 = time.perf_counter()
+    for topic, state, action, reward in messages:
+        if qos == 0:
+            send_mqtt(state, action, reward, client, topic)
+        else:
+            client.publish(topic, mqtt_payload(state, action, reward), qos=qos)
+    caller = time.perf_counter() - t0
+    return client, caller, t0
+
+
+def run_publisher(host, port, messages, qos, binary):
+    publisher = Publisher(host, port, qos=qos, policy="drop_new", max_queue=len(messages), binary=binary).start()
+    t0 = time.perf_counter()
+    for topic, state, action, reward in messages:
+        publisher.send(topic, state, action, reward)
+    caller = time.perf_counter() - t0
+    return publisher, caller, t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT publishing throughput against a local broker")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--athletes", type=int, default=500, help="number of athlete topics")
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    args = parser.parse_args()
+
+    broker, host, port = start_broker()
+    messages = sample_messages(args.messages, args.athletes)
+    _, state, action, reward = messages[0]
+    json_size, binary_size = len(mqtt_payload(state, action, reward)), len(encode_binary(state, action, reward))
+
+    print(f"{'mode':18} {'payload B':>10} {'caller µs/msg':>14} {'received':>10} {'msg/s':>10}")
+    for mode in ("legacy", "publisher/json", "publisher/binary"):
+        counter = Counter(host, port)
+        if mode == "legacy":
+            client, caller, t0 = run_legacy(host, port, messages, args.qos)
+        else:
+            client, caller, t0 = run_publisher(host, port, messages, args.qos, binary=mode.endswith("binary"))
+        end = counter.wait(len(messages))
+        if mode == "legacy":
+            client.loop_stop()
+        else:
+            client.close()
+        size = binary_size if mode.endswith("binary") else json_size
+        print(f"{mode:18} {size:10} {caller / len(messages) * 1e6:14.1f} {counter.count:10,} "
+              f"{counter.count / (end - t0):10,.0f}")
+        counter.stop()
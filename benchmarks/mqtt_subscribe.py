@@ -0,0 +1,88 @@
+'''
+Throughput and memory of the mqtt.py subscriber table.
+
+- table: AthleteTable.update fed directly with binary and JSON payloads (the cost per message in the subscriber);
+- broker: end to end through the local broker (local_broker.py, in-process), many athletes publishing binary
+  payloads as fast as possible to smartpacer/<athlete>/action, the subscriber counting and storing them.
+
+The peak resident memory is read in the middle and at the end of the stream: it must not grow with the number of
+messages.
+
+    python -m benchmarks.mqtt_subscribe --messages 200000 --athletes 200
+'''
+
+import time
+import argparse
+import threading
+import resource
+import warnings
+
+import paho.mqtt.client as mqtt
+
+from local_broker import start_broker
+from mqtt import AthleteTable, athlete_of
+from publisher import encode_binary
+from utils import mqtt_payload
+from benchmarks.mqtt_publish import sample_messages
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def bench_table(messages, binary):
+    table = AthleteTable()
+    payloads = [(athlete_of(topic), encode_binary(state, action, reward) if binary
+                 else mqtt_payload(state, action, reward).encode()) for topic, state, action, reward in messages]
+    update = table.update
+    t0 = time.perf_counter()
+    for athlete, payload in payloads:
+        update(athlete, payload, t0)
+    return len(payloads) / (time.perf_counter() - t0)
+
+
+def bench_broker(messages):
+    broker, host, port = start_broker()
+    table = AthleteTable()
+    subscribed = threading.Event()
+
+    sub = mqtt.Client()
+    sub.on_connect = lambda c, u, f, rc: c.subscribe("smartpacer/+/action")
+    sub.on_subscribe = lambda *args: subscribed.set()
+    sub.on_message = lambda c, u, msg: table.update(athlete_of(msg.topic), msg.payload, time.monotonic())
+    sub.connect(host, port, 60)
+    sub.loop_start()
+    subscribed.wait(5)
+
+    pub = mqtt.Client()
+    pub.connect(host, port, 60)
+    pub.loop_start()
+    payloads = [(topic, encode_binary(state, action, reward)) for topic, state, action, reward in messages]
+
+    half = len(payloads) // 2
+    t0 = time.perf_counter()
+    for i, (topic, payload) in enumerate(payloads):
+        pub.publish(topic, payload)
+        if i == half:
+            memory_half = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    while table.messages < len(payloads) * 0.99 and time.perf_counter() - t0 < 120:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    memory_end = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pub.loop_stop()
+    sub.loop_stop()
+    return table, elapsed, memory_half, memory_end
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and memory of the mqtt.py subscriber")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--athletes", type=int, default=200)
+    args = parser.parse_args()
+
+    messages = sample_messages(args.messages, args.athletes)
+    print(f"📥 table update, binary payload : {bench_table(messages, True):12,.0f} msg/s")
+    print(f"📥 table update, JSON payload   : {bench_table(messages, False):12,.0f} msg/s")
+
+    table, elapsed, memory_half, memory_end = bench_broker(messages)
+    print(f"📡 through the local broker     : {table.messages / elapsed:12,.0f} msg/s "
+          f"({table.messages:,} of {len(messages):,} received, {len(table.rows)} athletes)")
+    print(f"🧠 peak RSS at 50% / 100% of the stream: {memory_half / 1024:.1f} MB / {memory_end / 1024:.1f} MB")
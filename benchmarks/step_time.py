@@ -0,0 +1,76 @@
+'''
+Per-step cost of RunnerEnv.step for every athlete profile and training plan.
+With --rev the same measurement is repeated on the sources of another git revision (e.g. the commit before a change),
+so that the per-step cost before and after can be compared side by side:
+
+    python -m benchmarks.step_time --rev HEAD~1
+'''
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CIRCUIT = "Parco acquedotti (Roma)"
+
+
+def measure(root, steps):
+    ''' Mean µs per RunnerEnv.step, using the runner_env module found in `root`.'''
+    sys.path.insert(0, root)
+    from runner_env import RunnerEnv, load_json, ACTIONS
+
+    athletes = load_json(os.path.join(ROOT, "data/athletes.json"))
+    trainings = load_json(os.path.join(ROOT, "data/trainings.json"))
+    track = load_json(os.path.join(ROOT, f"data/maps/{CIRCUIT}.json"))
+    rng = random.Random(0)
+    actions = [rng.choice(ACTIONS) for _ in range(steps)]
+
+    results = {}
+    for profile, athlete in athletes.items():
+        for name, training in trainings.items():
+            env = RunnerEnv(athlete, training, track_data=track, verbose=False)
+            env.reset()
+            t0 = time.perf_counter()
+            for action in actions:
+                _, _, done = env.step(action)
+                if done:
+                    env.reset()
+            results[f"{profile}/{name}"] = (time.perf_counter() - t0) / steps * 1e6
+    return results
+
+
+def measure_revision(rev, steps):
+    ''' Run `measure` in a fresh interpreter on the Python sources of a git revision.'''
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = subprocess.run(["git", "archive", rev, "--", "*.py"], cwd=ROOT, check=True, capture_output=True).stdout
+        subprocess.run(["tar", "-x", "-C", tmp], input=archive, check=True)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", tmp, "--steps", str(steps)],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-step cost of RunnerEnv.step")
+    parser.add_argument("--steps", type=int, default=20000, help="steps timed per athlete / training")
+    parser.add_argument("--rev", help="git revision to compare against (e.g. HEAD~1)")
+    parser.add_argument("--measure", metavar="ROOT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.steps)))
+        sys.exit(0)
+
+    after = measure(ROOT, args.steps)
+    before = measure_revision(args.rev, args.steps) if args.rev else None
+
+    print(f"{'athlete/training':28} {'µs/step':>10}" + (f" {args.rev + ' µs/step':>16} {'speedup':>8}" if before else ""))
+    for key, cost in after.items():
+        line = f"{key:28} {cost:10.2f}"
+        if before:
+            line += f" {before[key]:16.2f} {before[key] / cost:7.1f}x"
+        print(line)
@@ -0,0 +1,282 @@
+'''
+Benchmark suite: one run measures the simulator, the trainer, the Q-table loading, the GPX ingestion, the
+visualizer and the cold import times, and writes the results with the environment they were measured on to a JSON
+file; `compare` flags the metrics that regressed beyond a threshold between two runs.
+
+    python -m benchmarks.suite run                          # writes benchmarks/results/<date>_<revision>.json
+    python -m benchmarks.suite run --quick --only step,gpx
+    python -m benchmarks.suite compare base.json new.json --threshold 0.1
+
+Every metric is measured `repeat` times and the median is kept (the samples are stored too). Metrics are rates
+(higher is better) or latencies (lower is better), as recorded in their "better" field.
+'''
+
+import os
+import sys
+import glob
+import json
+import time
+import random
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+CIRCUIT = "Parco acquedotti (Roma)"
+SCHEMA = 1
+
+
+def metric(samples, unit, better="higher"):
+    return {"value": statistics.median(samples), "unit": unit, "better": better, "samples": samples}
+
+
+def repeated(fn, repeat):
+    ''' Samples of fn() (each one returns the measured value), after one warm-up call.'''
+    fn()
+    return [fn() for _ in range(repeat)]
+
+
+# === Benchmarks: each one returns {metric name: metric} ===
+
+def bench_step(quick, repeat):
+    ''' RunnerEnv.step, steps per second, for every athlete level and training plan (random actions).'''
+    from runner_env import RunnerEnv, load_json, ACTIONS
+    from track_store import load_track
+
+    steps = 2000 if quick else 20000
+    track = load_track(CIRCUIT)
+    rng = random.Random(0)
+    actions = [rng.choice(ACTIONS) for _ in range(steps)]
+    results = {}
+    for profile, athlete in load_json("data/athletes.json").items():
+        for name, training in load_json("data/trainings.json").items():
+            env = RunnerEnv(athlete, training, track_data=track, verbose=False)
+
+            def run():
+                env.reset()
+                t0 = time.perf_counter()
+                for action in actions:
+                    if env.step(action)[2]:
+                        env.reset()
+                return steps / (time.perf_counter() - t0)
+            results[f"step/{profile}/{name}"] = metric(repeated(run, repeat), "steps/s")
+    return results
+
+
+def bench_episode(quick, repeat):
+    ''' Full episodes (reset to done, random policy) per second for every training plan, runner profile.'''
+    from runner_env import RunnerEnv, load_json, ACTIONS
+    from track_store import load_track
+
+    track = load_track(CIRCUIT)
+    athlete = load_json("data/athletes.json")["runner"]
+    results = {}
+    for name, training in load_json("data/trainings.json").items():
+        env = RunnerEnv(athlete, training, track_data=track, verbose=False)
+        rng = random.Random(0)
+
+        def run():
+            t0 = time.perf_counter()
+            env.reset()
+            while not env.step(rng.choice(ACTIONS))[2]:
+                pass
+            return 1 / (time.perf_counter() - t0)
+        results[f"episode/{name}"] = metric(repeated(run, repeat), "episodes/s")
+    return results
+
+
+def bench_trainer(quick, repeat):
+    ''' q_learning_trainer.run_experiment, training episodes per second of one cell (outputs in a temporary folder).'''
+    import q_learning_trainer as trainer
+
+    episodes = 20 if quick else 100
+    params = trainer.hyperparameter_sets[0]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer.num_episodes, trainer.base_folder = episodes, tmp
+        os.makedirs(f"{tmp}/q-tables")
+        os.makedirs(f"{tmp}/rewards")
+        for training in ("fartlek", "endurance"):
+            def run():
+                t0 = time.perf_counter()
+                trainer.run_experiment("runner", training, params, seed=0)
+                return episodes / (time.perf_counter() - t0)
+            results[f"trainer/runner/{training}"] = metric(repeated(run, repeat), "episodes/s")
+    return results
+
+
+def bench_qtable(quick, repeat):
+    ''' Latency of loading a saved Q-table: utils.load_qtable (dict) and state_space.load_qtable_array (dense).'''
+    from utils import load_qtable
+    from state_space import load_qtable_array
+
+    def timed_ms(fn, *args):
+        def run():
+            t0 = time.perf_counter()
+            fn(*args)
+            return (time.perf_counter() - t0) * 1000
+        return run
+    return {
+        "load_qtable/utils": metric(repeated(timed_ms(load_qtable, "runner", "fartlek"), repeat), "ms", "lower"),
+        "load_qtable/array": metric(repeated(timed_ms(load_qtable_array, "data/q-tables/q_runner_fartlek.json"),
+                                             repeat), "ms", "lower"),
+    }
+
+
+def bench_gpx(quick, repeat):
+    ''' track.parse_gpx on the bundled GPX files, track points per second.'''
+    from track import parse_gpx
+
+    results = {}
+    for path in sorted(glob.glob("data/maps/*.GPX")):
+        def run():
+            t0 = time.perf_counter()
+            n = len(parse_gpx(path))
+            return n / (time.perf_counter() - t0)
+        results[f"parse_gpx/{os.path.basename(path)}"] = metric(repeated(run, repeat), "points/s")
+    return results
+
+
+def bench_visualizer(quick, repeat):
+    ''' training_visualizer.render_video frames per second, without basemap and encoding.'''
+    from benchmarks.visualizer import NullSink, simulate_log
+    from training_visualizer import load_log, render_video
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "recovery.csv")
+        simulate_log(path, CIRCUIT, "recovery")
+        df = load_log(path)
+    if quick:
+        df = df.iloc[:len(df) // 4]
+
+    def run():
+        t0 = time.perf_counter()
+        frames = render_video(df, "benchmark", None, basemap=False, sink=NullSink())
+        return frames / (time.perf_counter() - t0)
+    return {"visualizer/recovery": metric(repeated(run, max(1, repeat // 2)), "frames/s")}
+
+
+def bench_imports(quick, repeat):
+    ''' Cold import time of the modules of benchmarks.import_time, in fresh interpreters.'''
+    from benchmarks.import_time import BUDGETS, measure
+
+    return {f"import/{module}": metric(measure(module, repeat)["samples"], "ms", "lower") for module in BUDGETS}
+
+
+BENCHMARKS = {
+    "step": bench_step,
+    "episode": bench_episode,
+    "trainer": bench_trainer,
+    "qtable": bench_qtable,
+    "gpx": bench_gpx,
+    "visualizer": bench_visualizer,
+    "imports": bench_imports,
+}
+
+
+# === Runs ===
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment():
+    import numpy
+    import pandas
+    import matplotlib
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "hostname": platform.node(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "matplotlib": matplotlib.__version__,
+    }
+
+
+def run_suite(names, quick=False, repeat=5):
+    results = {"schema": SCHEMA, "created": datetime.datetime.now().isoformat(timespec="seconds"),
+               "quick": quick, "repeat": repeat, "environment": environment(), "metrics": {}}
+    for name in names:
+        t0 = time.perf_counter()
+        metrics = BENCHMARKS[name](quick, repeat)
+        results["metrics"].update(metrics)
+        print(f"⏱️  {name}: {len(metrics)} metrics in {time.perf_counter() - t0:.1f}s")
+        for key, m in metrics.items():
+            print(f"    {key:40} {m['value']:14,.2f} {m['unit']}")
+    return results
+
+
+def compare(base, new, threshold):
+    ''' Rows (name, base value, new value, change, flag) of the metrics in both runs; change > 0 is an improvement.'''
+    rows = []
+    for name, m in new["metrics"].items():
+        if name not in base["metrics"]:
+            continue
+        b, n = base["metrics"][name]["value"], m["value"]
+        change = (n / b if m["better"] == "higher" else b / n) - 1
+        flag = "REGRESSION" if change < -threshold else "improved" if change > threshold else ""
+        rows.append((name, b, n, change, flag))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smart Pacer benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--only", help=f"comma-separated subset of: {','.join(BENCHMARKS)}")
+    run_parser.add_argument("--quick", action="store_true", help="smaller workloads, for a quick check")
+    run_parser.add_argument("--repeat", type=int, default=5, help="samples per metric (the median is kept)")
+    run_parser.add_argument("--out", help="results file (default: benchmarks/results/<date>_<revision>.json)")
+    compare_parser = sub.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="relative change flagged (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        os.chdir(ROOT)
+        names = args.only.split(",") if args.only else list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+        results = run_suite(names, args.quick, args.repeat)
+        out = args.out or os.path.join(RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+                                       + f"_{results['environment']['revision']}.json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {out}")
+    else:
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        for key in ("hostname", "cpu_count", "python", "numpy"):
+            if base["environment"].get(key) != new["environment"].get(key):
+                print(f"⚠️  different {key}: {base['environment'].get(key)} vs {new['environment'].get(key)}")
+        rows = compare(base, new, args.threshold)
+        print(f"{'metric':40} {base['environment']['revision']:>14} {new['environment']['revision']:>14} "
+              f"{'change':>8}")
+        for name, b, n, change, flag in rows:
+            print(f"{name:40} {b:14,.2f} {n:14,.2f} {change:+8.1%} {flag}")
+        regressions = sum(flag == "REGRESSION" for *_, flag in rows)
+        print(f"{'❌' if regressions else '✅'} {regressions} regressions beyond {args.threshold:.0%} "
+              f"over {len(rows)} metrics")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,107 @@
+'''
+Rendering time of training_visualizer on the 100-minute endurance session.
+A session log is simulated (runner profile, endurance plan) and recorded with SessionRecorder, then rendered:
+
+- legacy: the previous animate(i), which rebuilt the list of the i trail segments and of their colours, fetched the
+  row with df.iloc and formatted the info string at every frame, followed by the full redraw of the figure;
+- incremental: training_visualizer.render_video.
+
+Frames are rendered but not encoded (no ffmpeg) and without basemap, the same for both, so that only the per-frame
+work is compared. Both are timed on growing prefixes of the session to show how they scale.
+
+    python -m benchmarks.visualizer --circuit "Belfiore (MN)"
+'''
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+
+from runner_env import RunnerEnv, load_json, ACTIONS
+from track_store import load_track
+from session_recorder import SessionRecorder
+from training_visualizer import load_log, render_video, web_mercator, COLOR_MAP, FRAME_STEP
+
+
+class NullSink:
+    def write(self, rgba):
+        pass
+
+    def close(self):
+        pass
+
+
+def simulate_log(path, circuit, training_name="endurance", seed=0):
+    random.seed(seed)
+    track = load_track(circuit)
+    env = RunnerEnv(load_json("data/athletes.json")["runner"], load_json("data/trainings.json")[training_name],
+                    track_data=track, verbose=False)
+    state, done = env.reset(), False
+    with SessionRecorder(path, track=track, columnar="npz") as recorder:
+        while not done:
+            action = random.choice(ACTIONS)
+            state, reward, done = env.step(action)
+            recorder.record(state, action, reward, env.fatigue_score, env.track_index)
+
+
+def render_legacy(df):
+    ''' The per-frame work of the previous visualizer (without basemap and encoding).'''
+    xs, ys = web_mercator(df["lat"].to_numpy(float), df["lon"].to_numpy(float))
+    colors = df["fatigue"].map(COLOR_MAP).tolist()
+    fig = Figure(figsize=(10, 12), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    ax_map, ax_text = fig.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]})
+    ax_map.set_xlim(xs.min(), xs.max())
+    ax_map.set_ylim(ys.min(), ys.max())
+    scat, = ax_map.plot([], [], 'ro')
+    line = LineCollection([], linewidths=2)
+    ax_map.add_collection(line)
+    text_box = ax_text.text(0.05, 0.95, "", transform=ax_text.transAxes, fontsize=9, va='top', family='monospace')
+    ax_text.axis('off')
+
+    for i in range(0, len(df), FRAME_STEP):
+        segs = [[[xs[j], ys[j]], [xs[j+1], ys[j+1]]] for j in range(i)]
+        line.set_segments(segs)
+        line.set_color(colors[:i])
+        scat.set_data([xs[i]], [ys[i]])
+        row = df.iloc[i]
+        text_box.set_text(
+            f"Second: {int(row.second)}/{int(df.second.max())}\n"
+            f"Phase:   {row.phase}\n"
+            f"Action:  {row.action}\n"
+            f"Fatigue: {row.fatigue}\n"
+            f"HR Z:    {row.HR_zone}   Power Z: {row.power_zone}"
+        )
+        canvas.draw()
+        canvas.buffer_rgba()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendering time of the training visualizer")
+    parser.add_argument("--circuit", default="Belfiore (MN)")
+    parser.add_argument("--fractions", default="0.25,0.5,1.0", help="prefixes of the session to render")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "endurance.csv")
+        simulate_log(path, args.circuit)
+        df = load_log(path)
+
+    print(f"{'minutes':>8} {'frames':>7} {'legacy s':>9} {'incremental s':>14} {'speedup':>8}")
+    for fraction in (float(f) for f in args.fractions.split(",")):
+        part = df.iloc[:int(len(df) * fraction)].reset_index(drop=True)
+        legacy = timed(render_legacy, part)
+        incremental = timed(render_video, part, "benchmark", None, False, 100, 2000, NullSink())
+        print(f"{part.second.max() / 60:8.0f} {len(range(0, len(part), FRAME_STEP)):7d} {legacy:9.1f} "
+              f"{incremental:14.2f} {legacy / incremental:7.1f}x")
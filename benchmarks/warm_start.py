@@ -0,0 +1,65 @@
+'''
+Episodes to converge of a cold start (empty Q-table) and of a warm start (q_learning_trainer.seed_qtable: the table of
+the nearest other athlete profile trained on the same plan), for an athlete onboarded as if it were new.
+Both runs use the same seed and stop at convergence (convergence.py), checked from --min-episodes on: the default floor
+of the trainer (300 episodes) is there to let a cold start's exploration settle, and would hide most of the
+difference. Since a run can also converge early on a lower plateau, the episodes the warm start needs to reach the
+final reward of the cold start (50-episode moving average) are reported too. Outputs go to a temporary folder.
+
+    python -m benchmarks.warm_start --athlete amatour --trainings fartlek,endurance
+'''
+
+import os
+import argparse
+import tempfile
+
+import numpy as np
+
+import q_learning_trainer as trainer
+from convergence import DEFAULTS
+
+
+def run(athlete, training, warm_start, convergence):
+    params = trainer.hyperparameter_sets[0]
+    seed = trainer.cell_seed(0, athlete, training, trainer.experiment_label(params))
+    *_, rewards, _, _, info = trainer.run_experiment(athlete, training, params, seed, convergence=convergence,
+                                                     warm_start=warm_start)
+    return info, rewards
+
+
+def episodes_to_reach(rewards, target, window=50):
+    ''' First episode at which the moving average of the reward reaches target, None if it never does.'''
+    average = np.convolve(rewards, np.ones(window) / window, mode="valid")
+    reached = np.flatnonzero(average >= target)
+    return int(reached[0]) + window if len(reached) else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Episodes to converge, cold vs warm start")
+    parser.add_argument("--athlete", default="amatour")
+    parser.add_argument("--trainings", default="fartlek,endurance")
+    parser.add_argument("--episodes", type=int, default=2000, help="episode budget of a run")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the seed q-table values")
+    parser.add_argument("--epsilon", type=float, default=0.05, help="starting epsilon of the warm start")
+    parser.add_argument("--window", type=int, default=50, help="convergence window")
+    parser.add_argument("--min-episodes", type=int, default=100, help="first episode checked for convergence")
+    args = parser.parse_args()
+    convergence = dict(DEFAULTS, window=args.window, min_episodes=args.min_episodes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trainer.num_episodes, trainer.base_folder = args.episodes, tmp
+        os.makedirs(f"{tmp}/q-tables")
+        os.makedirs(f"{tmp}/rewards")
+        print(f"{'training':12} {'start':5} {'seed table':28} {'converged':>9} {'seconds':>8} {'final reward':>13} "
+              f"{'to cold final':>14}")
+        for training in args.trainings.split(","):
+            target = None
+            for warm_start in (None, {"scale": args.scale, "epsilon": args.epsilon}):
+                info, rewards = run(args.athlete, training, warm_start, convergence)
+                final = np.mean(rewards[-50:])
+                target = final if target is None else target
+                converged = info["converged_at"] or f">{info['budget']}"
+                reached = episodes_to_reach(rewards, target) or "-"
+                print(f"{training:12} {'warm' if warm_start else 'cold':5} "
+                      f"{os.path.basename(info['seed_table'] or '-'):28} {converged:>9} {info['seconds']:8.1f} "
+                      f"{final:13.1f} {reached:>14}")
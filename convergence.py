@@ -0,0 +1,52 @@
+'''
+Convergence detection for the Q-learning runs.
+A run has converged when, over the last `window` episodes, both:
+
+- the moving average of the episode reward stopped moving: its change between the previous window and the last one,
+  relative to its value, is below `reward_tol` (the slope of the moving average, over a window);
+- the Q-table stopped changing: the relative change of its Frobenius norm over the window is below `q_tol`.
+
+Nothing is checked before `min_episodes`, so that exploration (epsilon decay) has time to settle.
+'''
+
+from collections import deque
+
+import numpy as np
+
+DEFAULTS = {"window": 100, "reward_tol": 0.01, "q_tol": 0.01, "min_episodes": 300}
+
+
+class ConvergenceMonitor:
+    def __init__(self, window=100, reward_tol=0.01, q_tol=0.01, min_episodes=300):
+        self.window = window
+        self.reward_tol = reward_tol
+        self.q_tol = q_tol
+        self.min_episodes = max(min_episodes, 2 * window)
+        self.episodes = 0
+        self.converged_at = None
+        self.reward_change = self.q_change = None
+        self._rewards = deque(maxlen=2 * window)
+        self._q_norms = deque(maxlen=window + 1)
+
+    def update(self, episode_reward, q):
+        ''' Record an episode (its total reward and the Q-table after it); True once the run has converged.'''
+        self.episodes += 1
+        self._rewards.append(episode_reward)
+        self._q_norms.append(float(np.linalg.norm(q)))
+        if self.converged_at is not None:
+            return True
+        if self.episodes < self.min_episodes:
+            return False
+
+        rewards = np.fromiter(self._rewards, float)
+        previous, last = rewards[:self.window].mean(), rewards[self.window:].mean()
+        self.reward_change = abs(last - previous) / max(abs(previous), 1e-9)
+        self.q_change = abs(self._q_norms[-1] - self._q_norms[0]) / max(self._q_norms[0], 1e-9)
+        if self.reward_change < self.reward_tol and self.q_change < self.q_tol:
+            self.converged_at = self.episodes
+            return True
+        return False
+
+    def summary(self):
+        return {"converged_at": self.converged_at, "episodes": self.episodes,
+                "reward_change": self.reward_change, "q_change": self.q_change}
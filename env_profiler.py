@@ -0,0 +1,115 @@
+'''
+Opt-in profiling of RunnerEnv.step: cumulative time and calls of every phase of a step and the breakdown of the
+reward into its components.
+
+Profiling costs nothing when it is off: StepProfiler.attach shadows the phase methods of one environment with timed
+wrappers (instance attributes), so the class methods, which every other environment keeps calling, are untouched.
+detach removes the wrappers.
+
+    profiler = env.enable_profiling()
+    ... run episodes ...
+    print(profiler.report())
+
+External profilers can be attached with add_hook: a hook is called as hook(phase, t_start, t_end) with the
+time.perf_counter() bounds of every timed phase (e.g. to emit trace events).
+'''
+
+import json
+import time
+
+# Timed methods of RunnerEnv: the phases of a step, and the whole step
+STEP_PHASES = {
+    "power_zone": "_update_power_zone",
+    "hr_zone": "_update_hr_zone",
+    "fatigue": "_update_fatigue",
+    "advance_segment": "_advance_segment",
+    "reward": "_compute_reward",
+}
+# Components of the reward, in the order RunnerEnv._compute_reward accumulates them
+REWARD_TERMS = ("hr_zone", "power_zone", "coherence", "phase", "fatigue", "capacity", "slope", "funnel",
+                "fatigue_decay", "noise")
+
+
+class StepProfiler:
+    def __init__(self):
+        self.seconds = dict.fromkeys(["step", *STEP_PHASES], 0.0)
+        self.calls = dict.fromkeys(["step", *STEP_PHASES], 0)
+        self.reward_terms = [0.0] * len(REWARD_TERMS)
+        self.hooks = []
+
+    def add_hook(self, hook):
+        ''' Call hook(phase, t_start, t_end) after every timed phase.'''
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def attach(self, env):
+        ''' Time the step phases of `env` (and only of it).'''
+        env.step = self._timed(env.step, "step")
+        for phase, name in STEP_PHASES.items():
+            setattr(env, name, self._timed(getattr(env, name), phase))
+        reward = env._compute_reward
+        env._compute_reward = lambda action: reward(action, self.reward_terms)
+        return self
+
+    def detach(self, env):
+        for name in ["step", *STEP_PHASES.values()]:
+            env.__dict__.pop(name, None)
+
+    def _timed(self, method, phase):
+        seconds, calls, hooks = self.seconds, self.calls, self.hooks
+        perf_counter = time.perf_counter
+
+        def timed(*args):
+            t0 = perf_counter()
+            result = method(*args)
+            t1 = perf_counter()
+            seconds[phase] += t1 - t0
+            calls[phase] += 1
+            for hook in hooks:
+                hook(phase, t0, t1)
+            return result
+        return timed
+
+    def merge(self, profile):
+        ''' Add the counters of another profile (a StepProfiler or a dict from profile()).'''
+        if isinstance(profile, StepProfiler):
+            profile = profile.profile()
+        for phase, row in profile["phases"].items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + row["seconds"]
+            self.calls[phase] = self.calls.get(phase, 0) + row["calls"]
+        for i, term in enumerate(REWARD_TERMS):
+            self.reward_terms[i] += profile["reward_terms"][term]["total"]
+        return self
+
+    def profile(self):
+        ''' Counters as a JSON-friendly dict.'''
+        steps = self.calls["step"] or 1
+        step_seconds = self.seconds["step"] or 1.0
+        return {
+            "steps": self.calls["step"],
+            "phases": {phase: {"seconds": self.seconds[phase], "calls": self.calls[phase],
+                               "us_per_call": self.seconds[phase] / (self.calls[phase] or 1) * 1e6,
+                               "share": self.seconds[phase] / step_seconds}
+                       for phase in self.seconds},
+            "reward_terms": {term: {"total": total, "per_step": total / steps}
+                             for term, total in zip(REWARD_TERMS, self.reward_terms)},
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.profile(), f, indent=2)
+
+    def report(self):
+        ''' Text table of the phases and of the reward components.'''
+        profile = self.profile()
+        lines = [f"{'phase':16} {'calls':>10} {'total s':>9} {'µs/call':>8} {'share':>6}"]
+        for phase, row in profile["phases"].items():
+            lines.append(f"{phase:16} {row['calls']:10,} {row['seconds']:9.3f} {row['us_per_call']:8.2f} "
+                         f"{row['share']:6.1%}")
+        lines.append(f"{'reward term':16} {'per step':>10}")
+        for term, row in profile["reward_terms"].items():
+            lines.append(f"{term:16} {row['per_step']:10.3f}")
+        return "\n".join(lines)
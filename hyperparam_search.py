@@ -0,0 +1,147 @@
+'''
+Hyperparameter search for the Q-learning trainer by successive halving.
+Configurations (alpha, gamma, initial epsilon, decay rate) are sampled from ranges and trained in rungs of growing
+episode budgets: after each rung only the best 1/eta of the configurations, ranked by their mean reward over the last
+episodes, keep training (from where they stopped, Q-table and epsilon included) up to the budget of the next rung.
+With the defaults, 27 configurations are trained for 74, 222, 667 and 2000 episodes: about 6000 episodes in total,
+against 54000 to train all of them for 2000 episodes.
+
+The configurations of a rung are trained in parallel on a process pool. The Q-table of the winner is written to
+data/q-tables/q_<athlete>_<training>.json, with the log of the search (configurations, scores and promotions of every
+rung) in search_<athlete>_<training>.json next to it.
+
+    python hyperparam_search.py --athlete runner --training fartlek --workers 8
+'''
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import q_learning_trainer as trainer
+from runner_env import RunnerEnv, load_json
+from state_space import new_qtable, flat_view, save_qtable_array
+
+# Sampled hyperparameters: (distribution, low, high)
+SPACE = {
+    "alpha": ("log", 0.01, 0.3),
+    "gamma": ("uniform", 0.85, 0.995),
+    "initial_epsilon": ("uniform", 0.05, 0.5),
+    "decay_rate": ("uniform", 0.95, 0.999),
+}
+MIN_EPSILON = 0.01
+SCORE_EPISODES = 50  # a configuration is ranked by its mean reward over its last episodes
+
+
+def sample_params(rng):
+    params = {"min_epsilon": MIN_EPSILON}
+    for name, (dist, low, high) in SPACE.items():
+        if dist == "log":
+            params[name] = round(math.exp(rng.uniform(math.log(low), math.log(high))), 4)
+        else:
+            params[name] = round(rng.uniform(low, high), 4)
+    return params
+
+
+def rung_budgets(max_episodes, eta, rungs):
+    ''' Cumulative episodes of every rung, the last one being max_episodes.'''
+    return [max(1, round(max_episodes / eta**k)) for k in reversed(range(rungs))]
+
+
+def advance(trial, athlete, training, episodes):
+    ''' Train a configuration for `episodes` more episodes, resuming its Q-table and epsilon. Runs in the workers.'''
+    random.seed(trial["seed"] + trial["episodes"])  # the same whatever the worker and the order of the trials
+    if trial["table"] is None:
+        trial["table"], trial["visited"] = new_qtable()
+    env = RunnerEnv(load_json("data/athletes.json")[athlete], load_json("data/trainings.json")[training],
+                    track_data=trainer.get_track(), verbose=False)
+    rewards, _, _, trial["eps"] = trainer.train_episodes(env, flat_view(trial["table"]), trial["visited"],
+                                                         trial["params"], trial["eps"], episodes)
+    trial["rewards"].extend(rewards)
+    trial["episodes"] += episodes
+    trial["score"] = float(np.mean(trial["rewards"][-SCORE_EPISODES:]))
+    return trial
+
+
+def successive_halving(athlete, training, configs=27, max_episodes=2000, eta=3, rungs=4, workers=1, seed=0):
+    ''' Run the search. Returns (winner trial, log).'''
+    rng = random.Random(seed)
+    trials = []
+    for i in range(configs):
+        params = sample_params(rng)
+        trials.append({"id": i, "params": params, "seed": trainer.cell_seed(seed, athlete, training, str(i)),
+                       "eps": params["initial_epsilon"], "episodes": 0, "rewards": [], "table": None,
+                       "visited": None, "score": None})
+    budgets = rung_budgets(max_episodes, eta, rungs)
+    log = {"athlete": athlete, "training": training, "seed": seed, "eta": eta, "space": SPACE, "budgets": budgets,
+           "rungs": []}
+    t0 = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for k, budget in enumerate(budgets):
+            jobs = [(trial, athlete, training, budget - trial["episodes"]) for trial in trials]
+            if pool:
+                trials = [future.result() for future in [pool.submit(advance, *job) for job in jobs]]
+            else:
+                trials = [advance(*job) for job in jobs]
+            trials.sort(key=lambda trial: trial["score"], reverse=True)
+            keep = max(1, len(trials) // eta) if k < len(budgets) - 1 else 1
+            log["rungs"].append({
+                "rung": k, "episodes": budget,
+                "trials": [{"id": t["id"], "params": t["params"], "score": t["score"], "promoted": rank < keep}
+                           for rank, t in enumerate(trials)],
+            })
+            best = trials[0]
+            print(f"🪜 rung {k}: {len(trials)} configurations at {budget} episodes, best #{best['id']} "
+                  f"score={best['score']:.1f}, {keep} promoted")
+            trials = trials[:keep]
+    finally:
+        if pool:
+            pool.shutdown()
+
+    winner = trials[0]
+    episodes = sum(rung["episodes"] - (budgets[k - 1] if k else 0) for k, rung in enumerate(log["rungs"])
+                   for _ in rung["trials"])
+    log.update({
+        "winner": {"id": winner["id"], "params": winner["params"], "score": winner["score"],
+                   "label": trainer.experiment_label(winner["params"])},
+        "winner_rewards": winner["rewards"],
+        "episodes": episodes,
+        "exhaustive_episodes": configs * max_episodes,
+        "seconds": time.perf_counter() - t0,
+    })
+    return winner, log
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive halving search of the Q-learning hyperparameters")
+    parser.add_argument("--athlete", default="runner")
+    parser.add_argument("--training", default="fartlek")
+    parser.add_argument("--configs", type=int, default=27, help="sampled configurations")
+    parser.add_argument("--episodes", type=int, default=trainer.num_episodes, help="episodes of the last rung")
+    parser.add_argument("--eta", type=int, default=3, help="1/eta of the configurations are promoted at every rung")
+    parser.add_argument("--rungs", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="data/q-tables", help="directory of the winner's Q-table and of the log")
+    args = parser.parse_args()
+
+    winner, log = successive_halving(args.athlete, args.training, args.configs, args.episodes, args.eta, args.rungs,
+                                     args.workers, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    qpath = os.path.join(args.out, f"q_{args.athlete}_{args.training}.json")
+    save_qtable_array(qpath, winner["table"], winner["visited"])
+    log["qtable"] = qpath
+    log_path = os.path.join(args.out, f"search_{args.athlete}_{args.training}.json")
+    with open(log_path, "w") as f:
+        json.dump(log, f, indent=2)
+
+    print(f"🏆 #{winner['id']} {winner['params']} score={winner['score']:.1f}")
+    print(f"✅ {log['episodes']} episodes instead of {log['exhaustive_episodes']} "
+          f"({log['episodes'] / log['exhaustive_episodes']:.0%}) in {log['seconds']:.0f}s. "
+          f"Q-table: {qpath}, log: {log_path}")
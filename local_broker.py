@@ -0,0 +1,162 @@
+'''
+Minimal local MQTT broker, a stand-in for broker.emqx.io when testing and benchmarking.
+It speaks enough MQTT 3.1.1 over TCP for paho-mqtt clients: CONNECT, PUBLISH (QoS 0, 1 and 2), SUBSCRIBE and
+UNSUBSCRIBE with + and # wildcards, PINGREQ and DISCONNECT. Subscriptions are granted QoS 0, retained messages and
+sessions are not stored. A subscriber that does not read fast enough gets messages dropped instead of growing the
+broker memory.
+
+    python local_broker.py --port 1883
+
+From Python, start_broker() runs it in a background thread and returns its address.
+'''
+
+import asyncio
+import argparse
+import struct
+import threading
+
+from paho.mqtt.client import topic_matches_sub
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+MAX_WRITE_BUFFER = 4 * 1024 * 1024  # bytes queued to a subscriber before its messages are dropped
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        n, byte = divmod(n, 128)
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def packet(kind, body=b"", flags=0):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def _string(data, pos):
+    (n,) = struct.unpack_from("!H", data, pos)
+    return data[pos + 2:pos + 2 + n].decode(), pos + 2 + n
+
+
+class LocalBroker:
+    def __init__(self):
+        self.subscriptions = {}   # writer -> set of topic filters
+        self._routes = {}         # topic -> subscribed writers (cache, cleared when the subscriptions change)
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def serve(self, host="127.0.0.1", port=1883):
+        return await asyncio.start_server(self._handle, host, port)
+
+    def _subscribers(self, topic):
+        writers = self._routes.get(topic)
+        if writers is None:
+            writers = self._routes[topic] = [w for w, filters in self.subscriptions.items()
+                                             if any(topic_matches_sub(f, topic) for f in filters)]
+        return writers
+
+    def _forward(self, topic, payload):
+        self.received += 1
+        message = None
+        for writer in self._subscribers(topic):
+            if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                self.dropped += 1
+                continue
+            if message is None:
+                t = topic.encode()
+                message = packet(PUBLISH, struct.pack("!H", len(t)) + t + payload)
+            writer.write(message)
+            self.delivered += 1
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        length, shift = 0, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header[0] >> 4, header[0] & 0x0F, await reader.readexactly(length)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                kind, flags, body = await self._read_packet(reader)
+                if kind == PUBLISH:
+                    qos = (flags >> 1) & 3
+                    topic, pos = _string(body, 0)
+                    if qos:
+                        packet_id = body[pos:pos + 2]
+                        writer.write(packet(PUBACK if qos == 1 else PUBREC, packet_id))
+                        pos += 2
+                    self._forward(topic, body[pos:])
+                elif kind == PUBREL:
+                    writer.write(packet(PUBCOMP, body[:2]))
+                elif kind == CONNECT:
+                    writer.write(packet(CONNACK, b"\x00\x00"))
+                elif kind == SUBSCRIBE:
+                    pos, codes = 2, bytearray()
+                    while pos < len(body):
+                        topic_filter, pos = _string(body, pos)
+                        pos += 1  # requested QoS, always granted 0
+                        self.subscriptions.setdefault(writer, set()).add(topic_filter)
+                        codes.append(0)
+                    self._routes.clear()
+                    writer.write(packet(SUBACK, body[:2] + bytes(codes)))
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        topic_filter, pos = _string(body, pos)
+                        self.subscriptions.get(writer, set()).discard(topic_filter)
+                    self._routes.clear()
+                    writer.write(packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP))
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self.subscriptions.pop(writer, None) is not None:
+                self._routes.clear()
+            writer.close()
+
+
+def start_broker(host="127.0.0.1", port=0):
+    ''' Run a LocalBroker in a daemon thread. Returns (broker, host, port); port=0 picks a free port.'''
+    broker = LocalBroker()
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(broker.serve(host, port))
+        address["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="local-broker", daemon=True).start()
+    ready.wait()
+    return broker, host, address["port"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal local MQTT broker for tests and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    async def main():
+        server = await LocalBroker().serve(args.host, args.port)
+        print(f"📡 Local MQTT broker listening on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,14 +1,31 @@
-import paho.mqtt.client as mqtt
+'''
+Live view of the pacing actions of a squad of athletes.
+The subscriber listens to the per-athlete topics smartpacer/<athlete>/action (JSON or binary payloads, see
+publisher.py) and keeps only the latest state of every athlete in a compact table of preallocated arrays, so memory
+stays constant however many messages arrive. A consolidated view of the table is redrawn at a fixed rate instead of
+once per message; --follow prints the detailed card of one athlete under it.
+
+    python mqtt.py --refresh 2 --follow runner
+'''
+
+import sys
 import json
-from datetime import datetime
 import time
-
+import argparse
 import warnings
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from publisher import BINARY_PAYLOAD, PAYLOAD_VERSION, pack_codes, unpack_codes
+
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
 broker = "broker.emqx.io"
-topic = "smartpacer/action"
+topic = "smartpacer/+/action"
+REFRESH_HZ = 2.0      # redraws per second
+MAX_ATHLETES = 1024   # rows of the table; beyond that the athlete not heard from for longest is replaced
 
 class PacerLogger:
     @staticmethod
@@ -43,27 +60,134 @@ class PacerLogger:
         )
 
 
-def on_message(client, userdata, msg):
+class AthleteTable:
+    ''' Latest message of every athlete, one row per athlete in fixed-size arrays.'''
+
+    def __init__(self, capacity=MAX_ATHLETES):
+        self.capacity = capacity
+        self.rows = {}                      # athlete -> row
+        self.names = [None] * capacity
+        self.codes = np.zeros(capacity, dtype=np.uint16)    # packed action, zones, fatigue, phase, slope
+        self.second = np.zeros(capacity, dtype=np.uint32)
+        self.timestamp = np.zeros(capacity, dtype=np.uint32)
+        self.reward = np.zeros(capacity, dtype=np.float32)
+        self.count = np.zeros(capacity, dtype=np.uint32)
+        self.last_seen = np.zeros(capacity)
+        self.messages = 0
+        self.errors = 0
+
+    def _row(self, athlete):
+        row = self.rows.get(athlete)
+        if row is None:
+            if len(self.rows) < self.capacity:
+                row = len(self.rows)
+            else:
+                row = int(np.argmin(self.last_seen))
+                del self.rows[self.names[row]]
+            self.rows[athlete] = row
+            self.names[row] = athlete
+            self.count[row] = 0
+        return row
+
+    def update(self, athlete, raw, now):
+        ''' Store a JSON or binary payload as the latest state of an athlete.'''
+        if raw[:1] == b"{":
+            m = json.loads(raw)
+            codes = pack_codes(m["action"], m["hr_zone"], m["power_zone"], m["fatigue"], m["phase"], m["slope"])
+            second, timestamp, reward = m["second"], m["timestamp"], m["reward"]
+        else:
+            version, _, codes, second, timestamp, reward = BINARY_PAYLOAD.unpack(raw)
+            if version != PAYLOAD_VERSION:
+                raise ValueError(f"unknown payload version {version}")
+        row = self._row(athlete)
+        self.codes[row] = codes
+        self.second[row] = second
+        self.timestamp[row] = timestamp
+        self.reward[row] = reward
+        self.count[row] += 1
+        self.last_seen[row] = now
+        self.messages += 1
+
+    def message(self, athlete):
+        ''' Latest message of an athlete as a dict (same keys of the JSON payload), None if never seen.'''
+        row = self.rows.get(athlete)
+        if row is None:
+            return None
+        action, hr_zone, power_zone, fatigue, phase, slope = unpack_codes(int(self.codes[row]))
+        return {"second": int(self.second[row]), "phase": phase, "fatigue": fatigue, "action": action,
+                "hr_zone": hr_zone, "power_zone": power_zone, "reward": float(self.reward[row]),
+                "timestamp": int(self.timestamp[row]), "slope": slope}
+
+    def render(self, now, max_rows=40):
+        ''' Consolidated view: one line per athlete (sorted by name), at most max_rows lines.'''
+        lines = [f"{'ATHLETE':<16} {'TIME':>6} {'PHASE':<9} {'ACTION':<11} {'HR':>3} {'PWR':>3} "
+                 f"{'FATIGUE':<7} {'SLOPE':<9} {'REWARD':>7} {'MSGS':>7} {'AGE':>5}"]
+        for athlete in sorted(self.rows)[:max_rows]:
+            m = self.message(athlete)
+            row = self.rows[athlete]
+            mins, secs = divmod(m["timestamp"], 60)
+            lines.append(f"{athlete[:16]:<16} {mins:3d}:{secs:02d} {m['phase']:<9} {m['action'].upper():<11} "
+                         f"{m['hr_zone']:>3} {m['power_zone']:>3} {m['fatigue'].upper():<7} {m['slope']:<9} "
+                         f"{m['reward']:+7.2f} {int(self.count[row]):7d} {now - self.last_seen[row]:4.0f}s")
+        if len(self.rows) > max_rows:
+            lines.append(f"... and {len(self.rows) - max_rows} more athletes")
+        return "\n".join(lines)
+
+
+def athlete_of(topic_name):
+    ''' Athlete of a smartpacer/<athlete>/action topic.'''
+    parts = topic_name.split("/")
+    return parts[1] if len(parts) == 3 else topic_name
+
+
+def run_subscriber(host, port=1883, refresh=REFRESH_HZ, max_rows=40, follow=None, capacity=MAX_ATHLETES):
+    table = AthleteTable(capacity)
+
+    def on_message(client, userdata, msg):
+        try:
+            table.update(athlete_of(msg.topic), msg.payload, time.monotonic())
+        except Exception:
+            table.errors += 1
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(topic)
+        else:
+            print(f"❌ Connection failed. Codice: {rc}")
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port, 60)
+    client.loop_start()
+    print(f"\n\n ✅ Connected to {host}:{port}, 🔊 waiting for instructions on {topic}...")
+
+    last_messages, last_time = 0, time.monotonic()
     try:
-        payload = json.loads(msg.payload.decode())
-        print(PacerLogger.format_message(payload))
-        
-    except Exception as e:
-        print(f"❌ Error in parsing the message: {e}")
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print("\n\n ✅ Connected to MQTT broker successfully!")
-        print("🏃💨  Starting training...")
-        print("🔊 I'm waiting for instructions...")
-        print("="*50)
-        client.subscribe(topic)
-    else:
-        print(f"❌ Connection failed. Codice: {rc}")
-
-client = mqtt.Client()
-client.on_connect = on_connect
-client.on_message = on_message
-
-client.connect(broker, 1883, 60)
-client.loop_forever()
\ No newline at end of file
+        while True:
+            time.sleep(1.0 / refresh)
+            now = time.monotonic()
+            rate = (table.messages - last_messages) / (now - last_time)
+            last_messages, last_time = table.messages, now
+            view = [f"🏃 SMART PACER – {len(table.rows)} athletes | {table.messages:,} messages "
+                    f"({rate:,.0f}/s) | {table.errors} errors", "=" * 100, table.render(now, max_rows)]
+            if follow is not None and table.message(follow) is not None:
+                view.append(PacerLogger.format_message(table.message(follow)))
+            sys.stdout.write("\033[H\033[J" + "\n".join(view) + "\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live view of the pacing actions of many athletes")
+    parser.add_argument("--broker", default=broker)
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--refresh", type=float, default=REFRESH_HZ, help="redraws per second")
+    parser.add_argument("--rows", type=int, default=40, help="athletes shown")
+    parser.add_argument("--follow", help="athlete whose detailed card is shown under the table")
+    args = parser.parse_args()
+    run_subscriber(args.broker, args.port, args.refresh, args.rows, args.follow)
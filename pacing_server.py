@@ -0,0 +1,230 @@
+'''
+Asyncio pacing server: hosts many concurrent pacing sessions (one RunnerEnv each) in a single process.
+Every session ticks on its own schedule (its interval and start time); a single scheduler coroutine wakes up when the
+next session is due, takes all the sessions due by then and serves them as one batch:
+the states are encoded to integer indexes and the actions of all the sessions sharing a Q-table are read with one
+NumPy gather from the compiled greedy policy of the table (policy.py, compiled on first use if needed).
+The actions are published through one shared non-blocking Publisher (publisher.py), on the topic
+smartpacer/<session>/action.
+
+    python pacing_server.py --sessions 2000 --duration 30 --broker local
+
+`--broker local` starts the local MQTT stand-in (local_broker.py) in-process; at the end the server reports the CPU
+time per step and the number of sessions a core can sustain at the given tick interval.
+'''
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import argparse
+import itertools
+import warnings
+
+import numpy as np
+
+from runner_env import RunnerEnv, load_json, ACTIONS
+from state_space import encode_state
+from policy import load_or_compile
+from track_store import load_track
+from utils import get_profile_label
+from publisher import Publisher, POLICIES
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+TOPIC = "smartpacer/{session}/action"
+QTABLES_DIR = "data/q-tables"
+
+
+class Session:
+    ''' A pacing session: an athlete running a training plan on a circuit, stepped every `interval` seconds.
+    on_step(state, action, reward) is called after every step.'''
+
+    def __init__(self, session_id, athlete, training_name, track, interval=1.0, on_step=None, verbose=False):
+        self.id = session_id
+        self.profile_label = get_profile_label(athlete)
+        self.training_name = training_name
+        self.interval = interval
+        self.on_step = on_step
+        self.env = RunnerEnv(athlete, load_json("data/trainings.json")[training_name], track_data=track,
+                             verbose=verbose)
+        self.state = self.env.reset()
+        self.steps = 0
+        self.total_reward = 0.0
+        self.done = False
+        self.policy = None
+        self.topic = None
+
+
+class PacingServer:
+    def __init__(self, publisher=None, topic=TOPIC, qtables_dir=QTABLES_DIR, batch_window=0.01):
+        self.publisher = publisher      # shared Publisher (anything with send(topic, state, action, reward)), or None
+        self.topic = topic
+        self.batch_window = batch_window  # sessions due within this many seconds are served in the same batch
+        self.qtables_dir = qtables_dir
+        self.sessions = {}
+        self._policies = {}
+        self._schedule = []             # heap of (due time, sequence, session)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.finished = 0
+        self.steps = 0
+        self.ticks = 0
+        self.busy_cpu = 0.0
+        self.max_lag = 0.0
+        self._lag_sum = 0.0
+
+    def policy(self, profile_label, training_name):
+        ''' Compiled greedy policy of a Q-table, loaded once and shared by all the sessions using it.'''
+        key = (profile_label, training_name)
+        if key not in self._policies:
+            path = os.path.join(self.qtables_dir, f"q_{profile_label}_{training_name}.json")
+            self._policies[key] = load_or_compile(path)
+        return self._policies[key]
+
+    def add_session(self, session, delay=0.0):
+        ''' Schedule a session, first tick after `delay` seconds.'''
+        session.policy = self.policy(session.profile_label, session.training_name)
+        session.topic = self.topic.format(session=session.id)
+        self.sessions[session.id] = session
+        heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._seq), session))
+        self._wakeup.set()
+
+    async def run(self, stop_when_idle=False):
+        ''' Serve the sessions until cancelled (or, with stop_when_idle, until no session is left).'''
+        while True:
+            if not self._schedule:
+                if stop_when_idle:
+                    return
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            now = time.monotonic()
+            if self._schedule[0][0] > now:
+                # Sleep until the next session is due, or until a new session is added
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._schedule[0][0] - now)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            batch = []
+            horizon = now + self.batch_window
+            while self._schedule and self._schedule[0][0] <= horizon:
+                due, _, session = heapq.heappop(self._schedule)
+                batch.append((due, session))
+            self._tick(batch, now)
+            await asyncio.sleep(0)  # let the other coroutines run between two batches
+
+    def _tick(self, batch, now):
+        cpu = time.thread_time()  # only the server thread: the publisher threads (and a local broker) run apart
+        groups = {}
+        for due, session in batch:
+            lag = max(0.0, now - due)
+            self._lag_sum += lag
+            self.max_lag = max(self.max_lag, lag)
+            groups.setdefault(session.policy, []).append((due, session))
+
+        for policy, due_sessions in groups.items():
+            indexes = np.fromiter((encode_state(s.state) for _, s in due_sessions), dtype=np.int64,
+                                  count=len(due_sessions))
+            for (due, session), a in zip(due_sessions, policy.act_batch(indexes).tolist()):
+                self._step(session, ACTIONS[a])
+                if session.done:
+                    del self.sessions[session.id]
+                    self.finished += 1
+                else:
+                    # Fixed rate: the next tick is one interval after the scheduled one, not after now
+                    heapq.heappush(self._schedule, (due + session.interval, next(self._seq), session))
+
+        self.ticks += 1
+        self.steps += len(batch)
+        self.busy_cpu += time.thread_time() - cpu
+
+    def _step(self, session, action):
+        state, reward, session.done = session.env.step(action)
+        session.state = state
+        session.steps += 1
+        session.total_reward += reward
+        if session.on_step is not None:
+            session.on_step(state, action, reward)
+        if self.publisher is not None:
+            state["timestamp"] = session.steps
+            self.publisher.send(session.topic, state, action, reward)
+
+    def report(self, interval=1.0):
+        ''' Throughput statistics; sessions_per_core is how many sessions ticking every `interval` seconds one core
+        can serve, from the CPU time spent per step.'''
+        cpu_per_step = self.busy_cpu / self.steps if self.steps else 0.0
+        return {
+            "steps": self.steps,
+            "ticks": self.ticks,
+            "mean_batch": self.steps / self.ticks if self.ticks else 0.0,
+            "cpu_per_step_us": cpu_per_step * 1e6,
+            "mean_lag_ms": self._lag_sum / self.steps * 1e3 if self.steps else 0.0,
+            "max_lag_ms": self.max_lag * 1e3,
+            "sessions_per_core": interval / cpu_per_step if cpu_per_step else 0.0,
+        }
+
+
+async def serve_demo(server, n_sessions, interval, duration, seed=0):
+    ''' Start n_sessions sessions (cycling athlete profiles, trainings and circuits) spread over one interval,
+    then serve them for `duration` seconds.'''
+    rng = random.Random(seed)
+    athletes = load_json("data/athletes.json")
+    trainings = list(load_json("data/trainings.json"))
+    circuits = [load_track(c) for c in ("Parco acquedotti (Roma)", "Belfiore (MN)", "Sponde dei 3 laghi (MN)")]
+    combos = list(itertools.product(athletes.values(), trainings, circuits))
+
+    sessions = [Session(f"athlete{i:05d}", *combos[i % len(combos)], interval=interval) for i in range(n_sessions)]
+    for session in sessions:
+        server.add_session(session, delay=rng.uniform(0, interval))
+
+    cpu0, t0 = time.process_time(), time.monotonic()
+    try:
+        await asyncio.wait_for(server.run(stop_when_idle=True), duration)
+    except asyncio.TimeoutError:
+        pass
+    return time.process_time() - cpu0, time.monotonic() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asyncio multi-session pacing server")
+    parser.add_argument("--sessions", type=int, default=1000, help="number of concurrent sessions")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two ticks of a session")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to serve the sessions for")
+    parser.add_argument("--broker", default="local",
+                        help="MQTT broker host, 'local' for the in-process stand-in, 'none' to not publish")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    parser.add_argument("--format", default="json", choices=("json", "binary"),
+                        help="payload format (binary: the 16-byte payload of publisher.py, read by mqtt.py)")
+    parser.add_argument("--policy", default="coalesce", choices=POLICIES, help="what to drop when the queue is full")
+    args = parser.parse_args()
+
+    publisher = None
+    if args.broker != "none":
+        host, port = args.broker, args.port
+        if args.broker == "local":
+            from local_broker import start_broker
+            broker, host, port = start_broker()
+        publisher = Publisher(host, port, qos=args.qos, policy=args.policy, binary=args.format == "binary").start()
+
+    server = PacingServer(publisher)
+    print(f"🏃 Serving {args.sessions} sessions every {args.interval:g}s for {args.duration:g}s...")
+    cpu, wall = asyncio.run(serve_demo(server, args.sessions, args.interval, args.duration))
+    stats = server.report(args.interval)
+
+    print(f"✅ {stats['steps']:,} steps in {stats['ticks']:,} batches (mean {stats['mean_batch']:.1f} sessions), "
+          f"{server.finished} sessions finished")
+    print(f"⏱️  {stats['cpu_per_step_us']:.1f} µs CPU per step | lag mean {stats['mean_lag_ms']:.1f} ms, "
+          f"max {stats['max_lag_ms']:.1f} ms | process CPU {cpu / wall:.0%} of a core")
+    print(f"🚀 Sustained capacity at one tick every {args.interval:g}s: ~{stats['sessions_per_core']:,.0f} sessions per "
+          f"core (server thread), ~{stats['steps'] / cpu * args.interval:,.0f} counting the whole process "
+          f"(publisher threads{' and local broker' if args.broker == 'local' else ''})")
+    if publisher is not None:
+        publisher.close()
+        print(f"📡 Publisher: {publisher.stats()}")
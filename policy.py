@@ -0,0 +1,141 @@
+'''
+Compiled greedy policies: the only thing a pacing session needs from a Q-table is the best action of every state,
+so a table is compiled ahead of time into one action per encoded state index (state_space.encode_state), int8.
+
+States never visited in training have no Q-values: instead of falling back to "keep going" at run time, their action
+is resolved at compile time from the nearest visited state (weighted L1 distance over the state components, see
+NEIGHBOUR_WEIGHTS), so the policy is a plain lookup.
+
+A .pol file is a 24-byte header (magic, number of states and actions, shape of the state space) followed by the
+N_STATES action bytes: 22 KB, read in one call. load_policy returns a CompiledPolicy whose act(state) is an index
+into those bytes.
+
+    python policy.py                 # compile data/q-tables/q_*.json into .pol files next to them
+    python policy.py --check         # also verify them against the tables
+'''
+
+import os
+import glob
+import struct
+import argparse
+
+from runner_env import ACTIONS
+from state_space import encode_state, STATE_SHAPE, N_STATES, N_ACTIONS
+
+MAGIC = b"SPPOL01\0"
+HEADER = struct.Struct("<IB7B4x")  # n_states, n_actions, STATE_SHAPE
+HEADER_SIZE = len(MAGIC) + HEADER.size
+DEFAULT_ACTION = ACTIONS.index("keep going")
+# Weight of a difference in every state component, in key order: HR zone, power zone, fatigue, phase, target HR zone,
+# target power zone, slope. Zones and fatigue are ordinal (|difference| in levels); phase and slope are categorical
+# (0 or 1). A neighbour in another phase or with other targets is a different situation, so it costs more.
+NEIGHBOUR_WEIGHTS = (1, 1, 1, 4, 2, 2, 1)
+ORDINAL = (True, True, True, False, True, True, False)
+
+
+class CompiledPolicy:
+    ''' Greedy policy as one action index per state index.'''
+    __slots__ = ("actions", "_array")
+
+    def __init__(self, actions):
+        self.actions = bytes(actions)
+        self._array = None
+
+    def act_index(self, index):
+        return self.actions[index]
+
+    def act(self, state):
+        ''' Action label for a RunnerEnv state dict.'''
+        return ACTIONS[self.actions[encode_state(state)]]
+
+    def act_batch(self, indexes):
+        ''' Action indexes for an array of state indexes.'''
+        if self._array is None:
+            import numpy as np
+            self._array = np.frombuffer(self.actions, dtype=np.int8)
+        return self._array[indexes]
+
+
+def compile_policy(table, visited, chunk=1024):
+    ''' int8 action of every state: the argmax of the visited states (ties to the first action, like max() over the
+    dict tables), the action of the nearest visited state for the others.'''
+    import numpy as np
+
+    actions = np.full(N_STATES, DEFAULT_ACTION, dtype=np.int8)
+    actions[visited] = np.argmax(table[visited], axis=1)
+    seen = np.flatnonzero(visited)
+    unseen = np.flatnonzero(~visited)
+    if len(seen) == 0 or len(unseen) == 0:
+        return actions
+
+    coords = np.stack(np.unravel_index(np.arange(N_STATES), STATE_SHAPE), axis=1).astype(np.int16)
+    seen_coords = coords[seen]
+    for start in range(0, len(unseen), chunk):
+        block = unseen[start:start + chunk]
+        distance = np.zeros((len(block), len(seen)), dtype=np.int16)
+        for c, (weight, ordinal) in enumerate(zip(NEIGHBOUR_WEIGHTS, ORDINAL)):
+            diff = coords[block, c][:, None] - seen_coords[:, c][None, :]
+            distance += weight * (np.abs(diff) if ordinal else (diff != 0))
+        actions[block] = actions[seen[np.argmin(distance, axis=1)]]  # ties to the lowest state index
+    return actions
+
+
+def save_policy(path, actions):
+    ''' Write a .pol file atomically.'''
+    header = MAGIC + HEADER.pack(N_STATES, N_ACTIONS, *STATE_SHAPE)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(header + bytes(memoryview(actions).cast("B")))
+    os.replace(tmp, path)
+
+
+def load_policy(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a compiled policy")
+    n_states, n_actions, *shape = HEADER.unpack_from(data, len(MAGIC))
+    if (n_states, n_actions, tuple(shape)) != (N_STATES, N_ACTIONS, STATE_SHAPE) or len(data) != HEADER_SIZE + n_states:
+        raise ValueError(f"{path} was compiled for another state space, compile it again")
+    return CompiledPolicy(data[HEADER_SIZE:])
+
+
+def policy_path(qtable_path):
+    return os.path.splitext(qtable_path)[0] + ".pol"
+
+
+def compile_qtable(qtable_path):
+    ''' Compile a JSON Q-table into the .pol file next to it. Returns the CompiledPolicy.'''
+    from state_space import load_qtable_array
+
+    actions = compile_policy(*load_qtable_array(qtable_path))
+    save_policy(policy_path(qtable_path), actions)
+    return CompiledPolicy(actions.tobytes())
+
+
+def load_or_compile(qtable_path):
+    ''' The compiled policy of a Q-table, compiling it first if the .pol file is missing or older than the table.'''
+    path = policy_path(qtable_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(qtable_path):
+        return load_policy(path)
+    return compile_qtable(qtable_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the Q-tables into greedy policy files")
+    parser.add_argument("qtables", nargs="?", default="data/q-tables", help="a Q-table or a directory of Q-tables")
+    parser.add_argument("--check", action="store_true", help="verify the policies against the tables")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.qtables, "q_*.json"))) if os.path.isdir(args.qtables) else [args.qtables]
+    for path in paths:
+        policy = compile_qtable(path)
+        line = f"✅ {policy_path(path)}: {os.path.getsize(policy_path(path)):,} bytes"
+        if args.check:
+            import numpy as np
+            from state_space import load_qtable_array
+            table, visited = load_qtable_array(path)
+            loaded = load_policy(policy_path(path))
+            agree = np.array_equal(loaded.act_batch(np.flatnonzero(visited)), np.argmax(table[visited], axis=1))
+            line += f", {visited.sum():,} visited states {'match' if agree else 'DO NOT match'} the table"
+        print(line)
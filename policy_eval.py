@@ -0,0 +1,195 @@
+'''
+Monte Carlo evaluation of the greedy policies: every Q-table q_<profile>_<training>[_<label>].json of a directory is
+compiled (policy.py) and rolled out `episodes` times on every circuit of data/maps, with no exploration.
+
+The rollouts of a (policy, circuit) pair run as one VecRunnerEnv batch (all the episodes advance in lockstep, the
+actions of the whole batch are one gather from the compiled policy), and the pairs are spread over a process pool.
+For every pair, and for every policy over all the circuits, the report gives the mean and 95% confidence interval
+(normal approximation, mean ± 1.96 standard errors over the episodes) of:
+
+- the episode reward;
+- the fractions of the episode spent at low, medium and high fatigue;
+- the fractions of the episode with the HR zone, the power zone and both on the target of the plan.
+
+The comparison table is printed and written as CSV, with the full results as JSON; with --baseline (the JSON of a
+previous evaluation, e.g. before a retrain) the table also shows the change in mean reward and whether it is
+significant (confidence intervals not overlapping).
+
+    python policy_eval.py --episodes 2000 --workers 8
+    python policy_eval.py data/qtraining_runs_<date>_episodes2000/q-tables --baseline data/evaluation/evaluation.json
+'''
+
+import os
+import csv
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from runner_env import load_json, FATIGUE_LEVELS
+from vec_runner_env import VecRunnerEnv
+from state_space import encode_batch
+from policy import load_or_compile
+from track_store import load_track
+from q_learning_trainer import cell_seed
+
+ATHLETES_JSON = "data/athletes.json"
+TRAININGS_JSON = "data/trainings.json"
+MAPS_DIR = "data/maps"
+QTABLES_DIR = "data/q-tables"
+OUT_DIR = "data/evaluation"
+Z_95 = 1.96
+METRICS = ("reward", *(f"fatigue_{level}" for level in FATIGUE_LEVELS), "hr_in_target", "power_in_target",
+           "both_in_target")
+
+
+def find_policies(qtables_dir):
+    ''' (name, profile, training, Q-table path) of every Q-table of a directory, name being the file name without q_.'''
+    athletes, trainings = load_json(ATHLETES_JSON), load_json(TRAININGS_JSON)
+    policies = []
+    for path in sorted(glob.glob(os.path.join(qtables_dir, "q_*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0][2:]
+        profile, training, *_ = name.split("_", 2) + [""]
+        if profile in athletes and training in trainings:
+            policies.append((name, profile, training, path))
+    return policies
+
+
+def rollout(name, profile, training, qtable_path, circuit, episodes, seed=0):
+    ''' Roll out a greedy policy `episodes` times on a circuit. Returns (name, circuit, {metric: per-episode array}).'''
+    policy = load_or_compile(qtable_path)
+    env = VecRunnerEnv(load_json(ATHLETES_JSON)[profile], load_json(TRAININGS_JSON)[training],
+                       track_data=load_track(circuit), num_envs=episodes,
+                       seed=cell_seed(seed, profile, training, f"{name}|{circuit}"))
+    state = env.reset()
+    reward = np.zeros(episodes)
+    fatigue = np.zeros((len(FATIGUE_LEVELS), episodes))
+    hr_in = np.zeros(episodes)
+    power_in = np.zeros(episodes)
+    both_in = np.zeros(episodes)
+    steps, done = 0, False
+    while not done:
+        state, r, done = env.step(policy.act_batch(encode_batch(state)))
+        reward += r
+        for level in range(len(FATIGUE_LEVELS)):
+            fatigue[level] += state["fatigue_level"] == level
+        hr_ok = state["HR_zone"] == state["target_hr_zone"]
+        power_ok = state["power_zone"] == state["target_power_zone"]
+        hr_in += hr_ok
+        power_in += power_ok
+        both_in += hr_ok & power_ok
+        steps += 1
+
+    samples = {"reward": reward, "hr_in_target": hr_in / steps, "power_in_target": power_in / steps,
+               "both_in_target": both_in / steps}
+    for level, counts in zip(FATIGUE_LEVELS, fatigue):
+        samples[f"fatigue_{level}"] = counts / steps
+    return name, circuit, samples
+
+
+def summarise(samples):
+    ''' Mean and 95% confidence interval of every metric of a set of episodes.'''
+    summary = {"episodes": len(samples["reward"])}
+    for metric in METRICS:
+        x = samples[metric]
+        half = Z_95 * x.std(ddof=1) / np.sqrt(len(x)) if len(x) > 1 else 0.0
+        summary[metric] = {"mean": float(x.mean()), "ci_low": float(x.mean() - half), "ci_high": float(x.mean() + half)}
+    return summary
+
+
+def evaluate(qtables_dir=QTABLES_DIR, episodes=1000, workers=1, seed=0, circuits=None):
+    ''' Evaluate every policy of a directory on every circuit. Returns {policy: {circuit or "all": summary}}.'''
+    circuits = circuits or sorted(os.path.splitext(f)[0] for f in os.listdir(MAPS_DIR) if f.endswith(".json"))
+    policies = find_policies(qtables_dir)
+    jobs = [(*policy, circuit, episodes, seed) for policy in policies for circuit in circuits]
+    samples = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(rollout, *job) for job in jobs]):
+                name, circuit, result = future.result()
+                samples[name, circuit] = result
+    else:
+        for job in jobs:
+            name, circuit, result = rollout(*job)
+            samples[name, circuit] = result
+
+    results = {}
+    for name, *_ in policies:
+        results[name] = {circuit: summarise(samples[name, circuit]) for circuit in circuits}
+        pooled = {metric: np.concatenate([samples[name, circuit][metric] for circuit in circuits])
+                  for metric in METRICS}
+        results[name]["all"] = summarise(pooled)
+    return results
+
+
+def comparison_rows(results, baseline=None):
+    ''' Flat rows of the comparison table, one per policy and circuit (then "all"), with the baseline deltas.'''
+    rows = []
+    for name, by_circuit in results.items():
+        for circuit, summary in by_circuit.items():
+            row = {"policy": name, "circuit": circuit, "episodes": summary["episodes"]}
+            for metric in METRICS:
+                row.update({f"{metric}_{k}": v for k, v in summary[metric].items()})
+            base = (baseline or {}).get(name, {}).get(circuit)
+            if base is not None:
+                new, old = summary["reward"], base["reward"]
+                row["reward_delta"] = new["mean"] - old["mean"]
+                row["significant"] = new["ci_low"] > old["ci_high"] or new["ci_high"] < old["ci_low"]
+            rows.append(row)
+    return rows
+
+
+def format_table(rows):
+    lines = [f"{'policy':28} {'circuit':24} {'reward':>17} {'%low':>6} {'%med':>6} {'%high':>6} "
+             f"{'%HR ok':>7} {'%pow ok':>7} {'%both':>6}"]
+    for row in rows:
+        half = (row["reward_ci_high"] - row["reward_ci_low"]) / 2
+        line = (f"{row['policy']:28} {row['circuit']:24} {row['reward_mean']:9.1f} ± {half:5.1f} "
+                f"{row['fatigue_low_mean']:6.1%} {row['fatigue_medium_mean']:6.1%} {row['fatigue_high_mean']:6.1%} "
+                f"{row['hr_in_target_mean']:7.1%} {row['power_in_target_mean']:7.1%} {row['both_in_target_mean']:6.1%}")
+        if "reward_delta" in row:
+            line += f"  Δ {row['reward_delta']:+7.1f}{' *' if row['significant'] else ''}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def save(results, rows, out_dir):
+    ''' Write evaluation.json (full results) and evaluation.csv (comparison table). Returns their paths.'''
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = os.path.join(out_dir, "evaluation.json")
+    with open(json_path, "w") as f:
+        json.dump(results, f, indent=2)
+    csv_path = os.path.join(out_dir, "evaluation.csv")
+    fields = list(dict.fromkeys(key for row in rows for key in row))
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo evaluation of the greedy policies on every circuit")
+    parser.add_argument("qtables", nargs="?", default=QTABLES_DIR, help="directory of the Q-tables")
+    parser.add_argument("--episodes", type=int, default=1000, help="rollouts per policy and circuit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="evaluation.json of a previous evaluation to compare with")
+    parser.add_argument("--out", default=OUT_DIR, help="directory of evaluation.json and evaluation.csv")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results = evaluate(args.qtables, args.episodes, args.workers, args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    rows = comparison_rows(results, baseline)
+    print(format_table(rows))
+    json_path, csv_path = save(results, rows, args.out)
+    circuits = len(next(iter(results.values()))) - 1 if results else 0
+    print(f"✅ {len(results)} policies × {circuits} circuits × {args.episodes} episodes in "
+          f"{time.perf_counter() - t0:.1f}s. Results: {json_path}, table: {csv_path}")
@@ -0,0 +1,122 @@
+'''
+Index of the reference athlete profiles (data/athletes.json), to find the nearest profile of an athlete.
+Profiles are compared on FEATURES, each one standardised by the mean and standard deviation of the reference profiles
+(raw FTP watts would otherwise outweigh heart rates and weight), and looked up in a KD-tree, so a query visits a few
+leaves instead of every profile. The index is built once per file (rebuilt if the file changes) and shared;
+utils.get_profile_label uses it.
+
+    from profile_index import get_index
+    get_index().nearest({"HR_rest": 55, "HR_max": 182, "FTP": 330, "weight_kg": 72})   # 'runner'
+    get_index().match(squad)                                                            # one label per athlete
+'''
+
+import os
+
+import numpy as np
+
+from runner_env import load_json
+
+ATHLETES_JSON = "data/athletes.json"
+FEATURES = ("HR_rest", "HR_max", "FTP", "weight_kg")
+LEAF_SIZE = 8
+
+_INDEXES = {}  # path -> (mtime, ProfileIndex)
+
+
+class KDTree:
+    ''' Minimal KD-tree for nearest-neighbour queries: leaves of up to leaf_size points, split on the widest
+    dimension at the median.'''
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=float)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        # node i: split dimension (-1 for a leaf), split value, children, range of self.order for a leaf
+        self.dim, self.value, self.left, self.right, self.start, self.end = [], [], [], [], [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+
+    def _build(self, start, end):
+        node = len(self.dim)
+        for column in (self.dim, self.value, self.left, self.right, self.start, self.end):
+            column.append(-1)
+        self.start[node], self.end[node] = start, end
+        if end - start <= self.leaf_size:
+            return node
+        block = self.points[self.order[start:end]]
+        dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+        mid = (end - start) // 2
+        self.order[start:end] = self.order[start:end][np.argpartition(block[:, dim], mid)]
+        self.dim[node], self.value[node] = dim, float(self.points[self.order[start + mid], dim])
+        self.left[node] = self._build(start, start + mid)
+        self.right[node] = self._build(start + mid, end)
+        return node
+
+    def query(self, x):
+        ''' (index, distance) of the point nearest to x.'''
+        best, best_d2 = -1, np.inf
+        stack = [(0, 0.0)]  # (node, squared distance from x to the node's side of its parent split)
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_d2:
+                continue
+            dim = self.dim[node]
+            if dim < 0:
+                candidates = self.order[self.start[node]:self.end[node]]
+                d2 = ((self.points[candidates] - x) ** 2).sum(axis=1)
+                i = int(np.argmin(d2))
+                if d2[i] < best_d2:
+                    best, best_d2 = int(candidates[i]), float(d2[i])
+                continue
+            gap = x[dim] - self.value[node]
+            near, far = (self.left[node], self.right[node]) if gap < 0 else (self.right[node], self.left[node])
+            stack.append((far, gap * gap))  # the far side is at least |gap| away
+            stack.append((near, bound))
+        return best, float(np.sqrt(best_d2))
+
+
+class ProfileIndex:
+    def __init__(self, profiles, features=FEATURES):
+        self.labels = list(profiles)
+        self.features = features
+        raw = np.array([[profiles[label][f] for f in features] for label in self.labels], dtype=float)
+        self.mean = raw.mean(axis=0)
+        std = raw.std(axis=0)
+        self.std = np.where(std > 0, std, 1.0)
+        self.points = (raw - self.mean) / self.std
+        self.tree = KDTree(self.points)
+        self._position = {label: i for i, label in enumerate(self.labels)}
+
+    @classmethod
+    def from_json(cls, path=ATHLETES_JSON):
+        return cls(load_json(path))
+
+    def normalise(self, athletes):
+        ''' Standardised feature rows of an athlete dict, a list of them or an array of raw features.'''
+        if isinstance(athletes, dict):
+            athletes = [athletes]
+        if not isinstance(athletes, np.ndarray):
+            athletes = [[athlete[f] for f in self.features] for athlete in athletes]
+        return (np.asarray(athletes, dtype=float).reshape(-1, len(self.features)) - self.mean) / self.std
+
+    def nearest(self, athlete, candidates=None):
+        ''' Label of the reference profile nearest to an athlete. candidates restricts the choice to some labels.'''
+        x = self.normalise(athlete)[0]
+        if candidates is not None:
+            rows = [self._position[label] for label in candidates]
+            return self.labels[rows[int(np.argmin(((self.points[rows] - x) ** 2).sum(axis=1)))]]
+        return self.labels[self.tree.query(x)[0]]
+
+    def match(self, athletes):
+        ''' Labels of the nearest reference profiles of a whole squad (a list of athlete dicts, or an array of raw
+        FEATURES rows), in one call.'''
+        return [self.labels[self.tree.query(x)[0]] for x in self.normalise(athletes)]
+
+
+def get_index(path=ATHLETES_JSON):
+    ''' Shared ProfileIndex of a profiles file, built on first use and again only if the file changes.'''
+    mtime = os.path.getmtime(path)
+    cached = _INDEXES.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _INDEXES[path] = (mtime, ProfileIndex.from_json(path))
+    return cached[1]
@@ -0,0 +1,191 @@
+'''
+Non-blocking MQTT publisher of the pacing actions.
+utils.send_mqtt serializes a JSON dict and calls client.publish in the caller, without a network loop running, so
+under load the messages pile up inside the client. Publisher decouples the two sides:
+
+- publish() only puts the message in a bounded in-memory queue and returns immediately;
+- a sender thread drains the queue in batches into the MQTT client, whose network loop runs in its own thread;
+- when the queue is full the message is dropped according to the policy: "coalesce" keeps only the latest pending
+  message of every topic (an athlete only needs the last action) and drops the oldest topic when there is no room,
+  "drop_oldest" and "drop_new" keep a plain FIFO;
+- the QoS is configurable, and the payload is the JSON message of utils.send_mqtt or, opt-in (binary=True), a
+  fixed-layout binary one of 16 bytes that only subscribers decoding it (mqtt.py) can read.
+
+Binary payload (little endian), see encode_binary / decode_payload:
+
+    version u8 | reserved u8 | codes u16 | second u32 | timestamp u32 | reward f32
+    codes: action (2 bits) | HR zone - 1 (3) | power zone - 1 (3) | fatigue (2) | phase (2) | slope (2)
+
+The version byte is never "{", so a subscriber tells the two formats apart from the first byte.
+'''
+
+import json
+import struct
+import threading
+import warnings
+from collections import deque, OrderedDict
+
+from runner_env import ACTIONS, ZONES, FATIGUE_LEVELS, PHASES, SLOPES
+from utils import mqtt_payload
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+PAYLOAD_VERSION = 1
+BINARY_PAYLOAD = struct.Struct("<BBHIIf")
+POLICIES = ("coalesce", "drop_oldest", "drop_new")
+
+_ACTION = {a: i for i, a in enumerate(ACTIONS)}
+_ZONE = {z: i for i, z in enumerate(ZONES)}
+_FATIGUE = {f: i for i, f in enumerate(FATIGUE_LEVELS)}
+_PHASE = {p: i for i, p in enumerate(PHASES)}
+_SLOPE = {s: i for i, s in enumerate(SLOPES)}
+
+
+def pack_codes(action, hr_zone, power_zone, fatigue, phase, slope):
+    ''' The 14 bits of categorical fields of the binary payload.'''
+    return (_ACTION[action] << 12 | _ZONE[hr_zone] << 9 | _ZONE[power_zone] << 6
+            | _FATIGUE[fatigue] << 4 | _PHASE[phase] << 2 | _SLOPE[slope])
+
+
+def unpack_codes(codes):
+    ''' (action, hr_zone, power_zone, fatigue, phase, slope) labels of packed codes.'''
+    return (ACTIONS[codes >> 12 & 3], ZONES[codes >> 9 & 7], ZONES[codes >> 6 & 7],
+            FATIGUE_LEVELS[codes >> 4 & 3], PHASES[codes >> 2 & 3], SLOPES[codes & 3])
+
+
+def encode_binary(state, action, reward):
+    ''' 16-byte payload of a pacing step (same content of utils.mqtt_payload).'''
+    codes = pack_codes(action, state["HR_zone"], state["power_zone"], state["fatigue_level"], state["phase_label"],
+                       state["slope_level"])
+    return BINARY_PAYLOAD.pack(PAYLOAD_VERSION, 0, codes, state["segment_index"], state["timestamp"], reward)
+
+
+def decode_payload(raw):
+    ''' Message dict of a payload, JSON or binary.'''
+    if raw[:1] == b"{":
+        return json.loads(raw)
+    version, _, codes, second, timestamp, reward = BINARY_PAYLOAD.unpack(raw)
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"unknown payload version {version}")
+    action, hr_zone, power_zone, fatigue, phase, slope = unpack_codes(codes)
+    return {
+        "second": second,
+        "phase": phase,
+        "fatigue": fatigue,
+        "action": action,
+        "hr_zone": hr_zone,
+        "power_zone": power_zone,
+        "reward": reward,
+        "timestamp": timestamp,
+        "slope": slope,
+    }
+
+
+class Publisher:
+    def __init__(self, host="broker.emqx.io", port=1883, qos=0, max_queue=10000, policy="coalesce", binary=False,
+                 batch_size=256, client=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.host, self.port = host, port
+        self.qos = qos
+        self.max_queue = max_queue
+        self.policy = policy
+        self.binary = binary
+        self.batch_size = batch_size
+        self.client = client
+        self._owns_client = client is None  # a client created by start() is disconnected by close()
+        self._pending = OrderedDict() if policy == "coalesce" else deque()
+        self._lock = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._last = None  # MQTTMessageInfo of the last message handed to the client
+        self.queued = self.sent = self.dropped = self.coalesced = 0
+
+    def start(self):
+        ''' Connect (unless a client was given) and start the network loop and the sender thread.'''
+        if self.client is None:
+            import paho.mqtt.client as mqtt
+            self.client = mqtt.Client()
+            # the client's own queue is bounded too: our queue is the one that drops
+            self.client.max_queued_messages_set(self.max_queue)
+            self.client.connect(self.host, self.port, 60)
+            self.client.loop_start()
+        self._thread = threading.Thread(target=self._sender, name="mqtt-publisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def send(self, topic, state, action, reward):
+        ''' Queue the message of a pacing step. Never blocks; returns False if the message was dropped.'''
+        payload = encode_binary(state, action, reward) if self.binary else mqtt_payload(state, action, reward)
+        return self.publish(topic, payload)
+
+    def publish(self, topic, payload):
+        ''' Queue a raw payload. Never blocks; returns False if the message was dropped.'''
+        with self._lock:
+            pending = self._pending
+            if self.policy == "coalesce":
+                if topic in pending:
+                    pending[topic] = payload  # replaces the older message, keeps its place in the queue
+                    self.coalesced += 1
+                    return True
+                if len(pending) >= self.max_queue:
+                    pending.popitem(last=False)
+                    self.dropped += 1
+                pending[topic] = payload
+            else:
+                if len(pending) >= self.max_queue:
+                    self.dropped += 1
+                    if self.policy == "drop_new":
+                        return False
+                    pending.popleft()
+                pending.append((topic, payload))
+            self.queued += 1
+            if len(pending) == 1:
+                self._lock.notify()
+        return True
+
+    def _take_batch(self):
+        pending = self._pending
+        n = min(self.batch_size, len(pending))
+        if self.policy == "coalesce":
+            return [pending.popitem(last=False) for _ in range(n)]
+        return [pending.popleft() for _ in range(n)]
+
+    def _sender(self):
+        publish, qos = self.client.publish, self.qos
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                if not self._pending:
+                    return
+                batch = self._take_batch()
+            for topic, payload in batch:
+                info = publish(topic, payload, qos=qos)
+                if info.rc == 0:
+                    self.sent += 1
+                    self._last = info
+                else:
+                    self.dropped += 1
+
+    def close(self, timeout=5.0):
+        ''' Flush the queue (waiting up to `timeout` seconds) and stop the threads; a client created by start() is also
+        disconnected. A client given by the caller is left connected and looping.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._last is not None:
+            try:
+                self._last.wait_for_publish(timeout)  # the client writes its messages in order
+            except (RuntimeError, ValueError):
+                pass
+        if self._owns_client and self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self.queued, "sent": self.sent, "dropped": self.dropped,
+                    "coalesced": self.coalesced, "pending": len(self._pending)}
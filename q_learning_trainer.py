@@ -1,20 +1,28 @@
 import json
 import random
 import os
+import zlib
+import time
+import argparse
 from datetime import datetime
+from functools import lru_cache
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 from runner_env import RunnerEnv, load_json, ACTIONS
-from tqdm import tqdm
+from track_store import load_track
+from state_space import (encode_state, new_qtable, flat_view, greedy_action, save_qtable_array, load_qtable_array,
+                         N_ACTIONS)
+from utils import get_profile_label
+from convergence import ConvergenceMonitor, DEFAULTS as CONVERGENCE_DEFAULTS
+
+# Importing this module has no side effects: the track is loaded on first use, the output folder is created by
+# setup_output() (called by main()), and pandas, matplotlib and tqdm are only imported by the code that uses them.
 
 # === CONFIG ===
 num_episodes = 2000  # first block of experiments
-track = load_json("data/maps/Parco acquedotti (Roma).json")  # single circuit only
-athletes = list(load_json("data/athletes.json").keys())
-training_plans = list(load_json("data/trainings.json").keys())
+TRACK_NAME = "Parco acquedotti (Roma)"  # single circuit only
 
 # Hyperparameter sets for 500 episode test
 # hyperparameter_sets = [
@@ -40,27 +48,48 @@ hyperparameter_sets = [
 ]
 
 # OUTPUT setup
-today = datetime.now().strftime("%Y%m%d")
-base_folder = f"data/qtraining_runs_{today}_episodes{num_episodes}"
-os.makedirs(f"{base_folder}/q-tables", exist_ok=True)
-os.makedirs(f"{base_folder}/rewards", exist_ok=True)
+base_folder = None  # output folder of the runs, see setup_output
 
-# --- Helpers ---
-def get_state_key(state):
-    return (
-        state['HR_zone'], state['power_zone'], state['fatigue_level'],
-        state['phase_label'], state['target_hr_zone'],
-        state['target_power_zone'], state['slope_level']
-    )
+
+def setup_output(episodes=None):
+    '''Create the dated output folder of a training run (q-tables and rewards) and make it the default one'''
+    global base_folder
+    today = datetime.now().strftime("%Y%m%d")
+    base_folder = f"data/qtraining_runs_{today}_episodes{episodes or num_episodes}"
+    os.makedirs(f"{base_folder}/q-tables", exist_ok=True)
+    os.makedirs(f"{base_folder}/rewards", exist_ok=True)
+    return base_folder
 
 
-def choose_action(Q, state_key, epsilon):
-    if random.random() < epsilon or state_key not in Q:
-        return random.choice(ACTIONS)
-    return max(Q[state_key], key=Q[state_key].get)
+@lru_cache(maxsize=None)
+def get_track():
+    '''The training circuit, loaded once per process'''
+    return load_track(TRACK_NAME)
+
+# --- Helpers ---
+def choose_action(q, state_index, epsilon):
+    '''Epsilon-greedy action index, q is the flat view of the dense Q-table'''
+    if random.random() < epsilon:
+        return random.randrange(N_ACTIONS)
+    return greedy_action(q, state_index)
+
+def seed_qtable(athlete, training, table=None, scale=1.0, qtables_dir="data/q-tables"):
+    '''Q-table to warm-start a cell from: the given file, or the table of the nearest other athlete profile
+    (utils.get_profile_label) trained on the same plan. Values are multiplied by scale. Returns (Q, visited, path)'''
+    if table is None:
+        trained = [label for label in load_json("data/athletes.json")
+                   if label != athlete and os.path.exists(f"{qtables_dir}/q_{label}_{training}.json")]
+        if not trained:
+            raise FileNotFoundError(f"no q-table of another athlete for {training} in {qtables_dir}")
+        label = get_profile_label(load_json("data/athletes.json")[athlete], candidates=trained)
+        table = f"{qtables_dir}/q_{label}_{training}.json"
+    Q, visited = load_qtable_array(table)
+    Q *= scale
+    return Q, visited, table
 
 # --- Plotting ---
 def plot_convergence(results):
+    import matplotlib.pyplot as plt
     # results: list of (athlete, training, label, rewards, med_frac, high_frac)
     groups = defaultdict(list)
     for ath, tr, lbl, rw, *_ in results:
@@ -80,6 +109,8 @@ def plot_convergence(results):
 
 
 def plot_heatmap_final(results):
+    import pandas as pd
+    import matplotlib.pyplot as plt
     # pivot final reward (mean last 50) per athlete
     data = []
     for ath, tr, lbl, rw, *_ in results:
@@ -108,6 +139,7 @@ def plot_heatmap_final(results):
 
 
 def plot_convergence_grid(results, episodes):
+    import matplotlib.pyplot as plt
     # create grid of convergence curves: rows=athletes, cols=training_plans
     athletes_list = sorted({r[0] for r in results})
     trainings_list = sorted({r[1] for r in results})
@@ -148,7 +180,7 @@ def create_summary_report(results, base_folder):
     report_lines.append("Best Final Rewards and Fatigue Metrics:\n")
 
     best = {}
-    for athlete, training, cfg, rewards, med, high in results:
+    for athlete, training, cfg, rewards, med, high, *_ in results:
         key = (athlete, training)
         final = np.mean(rewards[-50:])
         if key not in best or final > best[key][2]:
@@ -160,71 +192,217 @@ def create_summary_report(results, base_folder):
             f"final={final:7.1f} | %med={med*100:5.1f}% | %high={high*100:5.1f}%"
         )
 
+    # Early stopping: episodes not run, and their estimated time from each run's own seconds per episode
+    budget = run = saved_seconds = 0
+    stopped = []
+    for athlete, training, cfg, rewards, *_, info in results:
+        budget += info["budget"]
+        run += info["episodes"]
+        saved_seconds += (info["budget"] - info["episodes"]) * info["seconds"] / info["episodes"]
+        if info["converged_at"] is not None:
+            stopped.append(f"- {athlete:8} | {training:12} | cfg={cfg:15} | converged at episode {info['converged_at']}")
+    if stopped:
+        report_lines.append("\nEarly stopping (converged runs):\n")
+        report_lines.extend(stopped)
+    report_lines.append(f"\nEpisodes run: {run}/{budget} ({1 - run / budget:.1%} saved, "
+                        f"~{saved_seconds / 60:.1f} CPU minutes)")
+    with open(os.path.join(base_folder, "convergence.json"), "w") as f:
+        json.dump({f"{ath}_{tr}_{cfg}": info for ath, tr, cfg, *_, info in results}, f, indent=2)
+
     report_path = os.path.join(base_folder, "summary_report.txt")
     with open(report_path, "w", encoding="utf-8") as f:
         f.write("\n".join(report_lines))
     print(f"📄 Summary report written to {report_path}")
 
+# --- Experiments ---
+def experiment_label(params):
+    a, g, e0 = params['alpha'], params['gamma'], params['initial_epsilon']
+    return f"a{int(a*100)}_g{int(g*100)}_e{int(e0*100)}"
+
+
+def cell_seed(base_seed, athlete, training, label):
+    '''Deterministic seed of one (athlete, training, params) cell: it does not depend on the order in which the cells are run'''
+    return zlib.crc32(f"{base_seed}|{athlete}|{training}|{label}".encode())
+
+
+def train_episodes(env, q, visited, params, eps, episodes, monitor=None, show_progress=False):
+    '''Q-learning on `episodes` episodes of env, updating q (flat view of the dense Q-table) and visited in place.
+    Stops early when monitor (a ConvergenceMonitor) reports convergence.
+    Returns the total reward and the medium / high fatigue fractions of every episode, and the final epsilon'''
+    a, g = params['alpha'], params['gamma']
+    min_e, decay = params['min_epsilon'], params['decay_rate']
+    rewards, med_frac, high_frac = [], [], []
+
+    progress = range(episodes)
+    if show_progress:
+        from tqdm import tqdm
+        progress = tqdm(progress, desc="Episodes", ncols=60)
+
+    for ep in progress:
+        state = env.reset()
+        key = encode_state(state)
+        visited[key] = True
+        done = False
+        total_r = 0
+        med_c = high_c = steps = 0
+
+        while not done:
+            action = choose_action(q, key, eps)
+            nxt, r, done = env.step(ACTIONS[action])
+            nk = encode_state(nxt)
+            visited[nk] = True
+            b = nk * N_ACTIONS
+            best_next = max(q[b], q[b + 1], q[b + 2])
+            i = key * N_ACTIONS + action
+            q[i] += a * (r + g * best_next - q[i])
+            key = nk
+            total_r += r
+            if nxt['fatigue_level']=="medium": med_c += 1
+            if nxt['fatigue_level']=="high":   high_c += 1
+            steps += 1
+
+        rewards.append(total_r)
+        med_frac.append(med_c/steps)
+        high_frac.append(high_c/steps)
+        eps = max(min_e, eps * decay)
+        if monitor and monitor.update(total_r, q):
+            break
+
+    return rewards, med_frac, high_frac, eps
+
+
+def run_experiment(athlete, training, params, seed, show_progress=False, profile=False, convergence=None,
+                   warm_start=None, out=None):
+    '''Train one (athlete, training, params) cell, save its q-table and rewards (in out, default base_folder) and
+    return its result row.
+    With profile=True the environment is profiled (env_profiler.py) and the profile is saved next to the rewards.
+    convergence (ConvergenceMonitor arguments) stops the run once it has converged, before num_episodes.
+    warm_start ({"table": path or None, "scale": 1.0, "epsilon": 0.05}) starts from an existing q-table (see
+    seed_qtable) with a lower starting epsilon, instead of an empty table'''
+    t0 = time.perf_counter()
+    out = out or base_folder
+    random.seed(seed)
+    e0 = params['initial_epsilon']
+    label = experiment_label(params)
+
+    if warm_start is None:
+        Q, visited = new_qtable()
+        eps, seed_table = e0, None
+    else:
+        Q, visited, seed_table = seed_qtable(athlete, training, warm_start.get("table"), warm_start.get("scale", 1.0))
+        eps = warm_start.get("epsilon", min(e0, 0.05))
+    q = flat_view(Q)
+    env = RunnerEnv(
+        load_json("data/athletes.json")[athlete],
+        load_json("data/trainings.json")[training],
+        track_data=get_track(), verbose=False
+    )
+    profiler = env.enable_profiling() if profile else None
+    monitor = ConvergenceMonitor(**convergence) if convergence is not None else None
+
+    rewards, med_frac, high_frac, eps = train_episodes(env, q, visited, params, eps, num_episodes, monitor,
+                                                       show_progress)
+
+    qpath = f"{out}/q-tables/q_{athlete}_{training}_{label}.json"
+    save_qtable_array(qpath, Q, visited)
+    rpath = f"{out}/rewards/r_{athlete}_{training}_{label}.json"
+    with open(rpath, 'w') as f: json.dump(rewards, f)
+    if profiler:
+        profiler.save(f"{out}/rewards/p_{athlete}_{training}_{label}.json")
+
+    info = {"budget": num_episodes, "episodes": len(rewards), "seconds": time.perf_counter() - t0,
+            "converged_at": monitor.converged_at if monitor else None, "seed_table": seed_table}
+    return (athlete, training, label, rewards, np.mean(med_frac[-50:]), np.mean(high_frac[-50:]), info)
+
+
+def run_grid(cells, workers=1, base_seed=0, profile=False, convergence=None, warm_start=None):
+    '''Run every (athlete, training, params) cell, serially or on a process pool.
+    Each cell has its own seed, so the outputs are the same whatever the number of workers; results are streamed as
+    they finish and returned in grid order.'''
+    jobs = [(ath, tr, params, cell_seed(base_seed, ath, tr, experiment_label(params))) for ath, tr, params in cells]
+    results = {}
+
+    if workers <= 1:
+        print(f"🔄 Running single-threaded: {len(jobs)} experiments, {num_episodes} episodes each...")
+        for i, (ath, tr, params, seed) in enumerate(jobs):
+            print(f"➡️ {ath} | {tr} | alpha={params['alpha']}, gamma={params['gamma']}, "
+                  f"eps0={params['initial_epsilon']}, decay={params['decay_rate']}")
+            results[i] = run_experiment(ath, tr, params, seed, show_progress=True, profile=profile,
+                                        convergence=convergence, warm_start=warm_start, out=base_folder)
+        return [results[i] for i in range(len(jobs))]
+
+    print(f"🔄 Running on {workers} processes: {len(jobs)} experiments, {num_episodes} episodes each...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # the output folder is passed explicitly: workers started with spawn re-import this module
+        futures = {pool.submit(run_experiment, *job, profile=profile, convergence=convergence,
+                               warm_start=warm_start, out=base_folder): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            ath, tr, label, rewards, *_, info = results[i]
+            stop = f" | converged at {info['converged_at']}" if info["converged_at"] else ""
+            print(f"✔️ [{len(results)}/{len(jobs)}] {ath} | {tr} | {label} | final={np.mean(rewards[-50:]):.1f}{stop}")
+    return [results[i] for i in range(len(jobs))]
+
+
+def aggregate_profiles(results, base_folder):
+    '''Merge the step profiles of all the cells into profile_summary.json and print it'''
+    from env_profiler import StepProfiler
+    total = StepProfiler()
+    for ath, tr, label, *_ in results:
+        with open(f"{base_folder}/rewards/p_{ath}_{tr}_{label}.json") as f:
+            total.merge(json.load(f))
+    total.save(os.path.join(base_folder, "profile_summary.json"))
+    print(f"⏱️ Step profile of {len(results)} experiments:\n{total.report()}")
+
 # === MAIN ===
-if __name__ == '__main__':
-    results = []
-
-    print(f"🔄 Running single-threaded: {len(athletes)*len(training_plans)*len(hyperparameter_sets)} experiments, {num_episodes} episodes each...")
-    for athlete in athletes:
-        for training in training_plans:
-            for params in hyperparameter_sets:
-                a, g = params['alpha'], params['gamma']
-                e0, min_e, decay = params['initial_epsilon'], params['min_epsilon'], params['decay_rate']
-                label = f"a{int(a*100)}_g{int(g*100)}_e{int(e0*100)}"
-                print(f"➡️ {athlete} | {training} | alpha={a}, gamma={g}, eps0={e0}, decay={decay}")
-
-                Q = {}
-                eps = e0
-                env = RunnerEnv(
-                    load_json("data/athletes.json")[athlete],
-                    load_json("data/trainings.json")[training],
-                    track_data=track, verbose=False
-                )
-
-                rewards, med_frac, high_frac = [], [], []
-
-                for ep in tqdm(range(num_episodes), desc="Episodes", ncols=60):
-                    state = env.reset()
-                    key = get_state_key(state)
-                    done = False
-                    total_r = 0
-                    med_c = high_c = steps = 0
-
-                    while not done:
-                        Q.setdefault(key, {act:0.0 for act in ACTIONS})
-                        action = choose_action(Q, key, eps)
-                        nxt, r, done = env.step(action)
-                        nk = get_state_key(nxt)
-                        Q.setdefault(nk, {act:0.0 for act in ACTIONS})
-                        best_next = max(Q[nk].values())
-                        Q[key][action] += a * (r + g * best_next - Q[key][action])
-                        key = nk
-                        total_r += r
-                        if nxt['fatigue_level']=="medium": med_c += 1
-                        if nxt['fatigue_level']=="high":   high_c += 1
-                        steps += 1
-
-                    rewards.append(total_r)
-                    med_frac.append(med_c/steps)
-                    high_frac.append(high_c/steps)
-                    eps = max(min_e, eps * decay)
-
-                qpath = f"{base_folder}/q-tables/q_{athlete}_{training}_{label}.json"
-                with open(qpath, 'w') as f: json.dump({str(k):v for k,v in Q.items()}, f, indent=2)
-                rpath = f"{base_folder}/rewards/r_{athlete}_{training}_{label}.json"
-                with open(rpath, 'w') as f: json.dump(rewards, f)
-
-                results.append((athlete, training, label, rewards, np.mean(med_frac[-50:]), np.mean(high_frac[-50:])))
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Q-tables for every athlete, training plan and hyperparameter set")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes (1 = single-threaded)")
+    parser.add_argument("--seed", type=int, default=0, help="base seed, every cell derives its own seed from it")
+    parser.add_argument("--profile", action="store_true", help="profile the environment steps (saved with the rewards)")
+    parser.add_argument("--early-stop", action="store_true", help="stop every run once it has converged (convergence.py)")
+    for name, default in CONVERGENCE_DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default,
+                            help=f"convergence criterion (default: {default})")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="start every run from the q-table of the nearest other athlete profile (same plan)")
+    parser.add_argument("--seed-table", help="start every run from this q-table instead (implies --warm-start)")
+    parser.add_argument("--seed-scale", type=float, default=1.0, help="scale of the seed q-table values")
+    parser.add_argument("--seed-epsilon", type=float, default=0.05, help="starting epsilon of a warm-started run")
+    parser.add_argument("--evaluate", type=int, default=0, metavar="EPISODES",
+                        help="roll out the trained greedy policies this many times per circuit (policy_eval.py)")
+    args = parser.parse_args(argv)
+    warm_start = ({"table": args.seed_table, "scale": args.seed_scale, "epsilon": args.seed_epsilon}
+                  if args.warm_start or args.seed_table else None)
+    convergence = {name: getattr(args, name) for name in CONVERGENCE_DEFAULTS} if args.early_stop else None
+
+    athletes = list(load_json("data/athletes.json").keys())
+    training_plans = list(load_json("data/trainings.json").keys())
+    setup_output()
+
+    cells = [(athlete, training, params)
+             for athlete in athletes for training in training_plans for params in hyperparameter_sets]
+    results = run_grid(cells, workers=min(args.workers, len(cells)), base_seed=args.seed, profile=args.profile,
+                       convergence=convergence, warm_start=warm_start)
+    if args.profile:
+        aggregate_profiles(results, base_folder)
 
     # generate plots, grid, heatmaps, and report
     plot_convergence(results)
     plot_convergence_grid(results, num_episodes)
     plot_heatmap_final(results)
     create_summary_report(results, base_folder)
+    if args.evaluate:
+        import policy_eval
+        evaluation = policy_eval.evaluate(f"{base_folder}/q-tables", args.evaluate, workers=args.workers,
+                                          seed=args.seed)
+        rows = policy_eval.comparison_rows(evaluation)
+        print(policy_eval.format_table(rows))
+        policy_eval.save(evaluation, rows, base_folder)
 
-    print(f"✅ All done. Outputs in {base_folder}")
\ No newline at end of file
+    print(f"✅ All done. Outputs in {base_folder}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+'''
+Render farm for the session videos of every athlete × training × circuit combination.
+
+- The combinations are rendered by a pool of processes (one per core by default), longest logs first.
+- A video is skipped when its output exists and the content hash of its source log and of the rendering parameters
+  matches the one recorded in the manifest (OUT_DIR/manifest.json), so an incremental run only renders what changed.
+- Videos are rendered to a temporary file next to the output and moved in place with os.replace, and the manifest is
+  rewritten atomically after every video: an interrupted run leaves no half-written file and resumes where it stopped.
+- Every video reports its rendering time; the summary reports how busy the workers were.
+
+    python render_farm.py --workers 8
+    python render_farm.py --only runner_endurance --force
+'''
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from runner_env import load_json
+import training_visualizer as tv
+
+ATHLETES_JSON = "data/athletes.json"
+TRAININGS_JSON = "data/trainings.json"
+MAPS_DIR = "data/maps"
+MANIFEST = "manifest.json"
+
+
+def render_params(basemap=True, dpi=100, bitrate=2000):
+    ''' Everything besides the log that changes the output video.'''
+    return {"version": tv.RENDER_VERSION, "step": tv.STEP, "frame_step": tv.FRAME_STEP, "fps": tv.FPS,
+            "basemap": basemap, "dpi": dpi, "bitrate": bitrate}
+
+
+def content_hash(path, params):
+    h = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def list_jobs(logs_dir, out_dir, params, only=None):
+    ''' One job per athlete × training × circuit combination whose session log exists.'''
+    jobs, missing = [], []
+    circuits = sorted(os.path.splitext(f)[0] for f in os.listdir(MAPS_DIR) if f.endswith(".json"))
+    for profile_label in load_json(ATHLETES_JSON):
+        for training_name in load_json(TRAININGS_JSON):
+            for circuit_name in circuits:
+                name = f"{profile_label}_{training_name}_{circuit_name}"
+                if only and only not in name:
+                    continue
+                log = os.path.join(logs_dir, name + ".csv")
+                source = tv.log_source(log)
+                if not os.path.exists(source):
+                    missing.append(name)
+                    continue
+                jobs.append({
+                    "name": name,
+                    "log": log,
+                    "source": source,
+                    "title": f"{profile_label} – {training_name} – {circuit_name}",
+                    "circuit": circuit_name,
+                    "output": os.path.join(out_dir, name + ".mp4"),
+                    "params": params,
+                    "hash": content_hash(source, params),
+                })
+    return jobs, missing
+
+
+def render_job(job):
+    ''' Render one video to a temporary file, then move it in place. Returns (name, frames, seconds).'''
+    t0 = time.perf_counter()
+    tmp = f"{job['output']}.tmp-{os.getpid()}"
+    params = job["params"]
+    try:
+        frames = tv.render_video(tv.load_log(job["log"]), job["title"], tmp,
+                                 basemap=params["basemap"], dpi=params["dpi"], bitrate=params["bitrate"],
+                                 extent=tv.circuit_extent(job["circuit"]))
+        os.replace(tmp, job["output"])
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return job["name"], frames, time.perf_counter() - t0
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"videos": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def run_farm(logs_dir=tv.CSV_DIR, out_dir=tv.OUT_DIR, workers=None, force=False, only=None, params=None):
+    ''' Render the videos that are missing or out of date. Returns the manifest.'''
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = load_manifest(manifest_path)
+    jobs, missing = list_jobs(logs_dir, out_dir, params or render_params(), only)
+    for name in missing:
+        print(f"⚠️  {name}: no session log in {logs_dir}")
+
+    todo = [job for job in jobs if force or not os.path.exists(job["output"])
+            or manifest["videos"].get(job["name"], {}).get("hash") != job["hash"]]
+    todo.sort(key=lambda job: os.path.getsize(job["source"]), reverse=True)  # longest first, for load balance
+    print(f"🎬 {len(todo)} videos to render, {len(jobs) - len(todo)} up to date")
+    if not todo:
+        return manifest
+
+    workers = max(1, min(workers or os.cpu_count(), len(todo)))
+    t0 = time.perf_counter()
+    busy, failed = 0.0, 0
+    by_name = {job["name"]: job for job in todo}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_job, job): job["name"] for job in todo}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                name, frames, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {name}: {e}")
+                continue
+            busy += seconds
+            manifest["videos"][name] = {
+                "hash": by_name[name]["hash"],
+                "source": by_name[name]["source"],
+                "frames": frames,
+                "render_seconds": round(seconds, 2),
+                "rendered_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+            save_manifest(manifest, manifest_path)
+            print(f"✅ {name}: {frames} frames in {seconds:.1f}s ({frames / seconds:.0f} fps)")
+
+    wall = time.perf_counter() - t0
+    print(f"🏁 {len(todo) - failed} rendered, {failed} failed in {wall:.1f}s with {workers} workers "
+          f"(workers busy {busy / (wall * workers):.0%})")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the session videos in parallel, skipping the up to date ones")
+    parser.add_argument("--logs", default=tv.CSV_DIR, help="directory of the session logs")
+    parser.add_argument("--out", default=tv.OUT_DIR, help="directory of the videos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--only", help="render only the combinations whose name contains this text")
+    parser.add_argument("--force", action="store_true", help="render again also the up to date videos")
+    parser.add_argument("--no-basemap", action="store_true")
+    parser.add_argument("--offline", action="store_true", help="basemaps from the tile cache only (tile_cache.py seed)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--bitrate", type=int, default=2000, help="kbit/s")
+    args = parser.parse_args()
+    if args.offline:
+        os.environ["SMARTPACER_TILES_OFFLINE"] = "1"  # inherited by the workers' TileCache
+
+    run_farm(args.logs, args.out, args.workers, args.force, args.only,
+             render_params(basemap=not args.no_basemap, dpi=args.dpi, bitrate=args.bitrate))
@@ -0,0 +1,186 @@
+'''
+Streaming recorder of a training session.
+Rows are appended to the CSV log as the session runs, through a buffer flushed every `flush_rows` rows or
+`flush_seconds` seconds, so a crash loses at most the last few seconds and memory does not grow with the session.
+The coordinates of every row are read from the track columns at the runner's track index (no per-row dicts).
+
+With columnar="npz" (or "parquet", if pyarrow is installed) the session is also written as typed columns next to the
+CSV: categorical fields as small integer codes, numbers as floats. load_session reads any of the three formats into the
+same DataFrame, and the columnar files load much faster than the CSV.
+'''
+
+import os
+import csv
+import time
+import datetime
+
+import numpy as np
+
+from runner_env import ACTIONS, ZONES, FATIGUE_LEVELS, PHASES, SLOPES
+
+FIELDNAMES = ['second', 'phase', 'action', 'reward', 'fatigue', 'HR_zone', 'power_zone', 'target_HR', 'target_power',
+              'fatigue_score', 'fatigue_level', 'slope', 'lat', 'lon', 'elevation']
+LOG_DIR = "simulation_training_logs"
+
+# Typed columns of the columnar formats; categorical ones are codes into their vocabulary
+VOCABULARIES = {'phase': PHASES, 'action': ACTIONS, 'fatigue': FATIGUE_LEVELS, 'HR_zone': ZONES, 'power_zone': ZONES,
+                'target_HR': ZONES, 'target_power': ZONES, 'slope': SLOPES}
+DTYPES = {'second': np.int32, 'reward': np.float64, 'fatigue_score': np.float64,
+          'lat': np.float64, 'lon': np.float64, 'elevation': np.float64}
+COLUMNS = [name for name in FIELDNAMES if name in VOCABULARIES or name in DTYPES]
+_CODES = {name: {label: i for i, label in enumerate(vocab)} for name, vocab in VOCABULARIES.items()}
+
+
+def session_log_path(athlete_profile, training_type, circuit_name, log_dir=LOG_DIR):
+    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(log_dir, f"{athlete_profile}_{training_type}_{circuit_name}_{today_date}.csv")
+
+
+class SessionRecorder:
+    def __init__(self, path, track=None, columnar=None, flush_rows=256, flush_seconds=5.0, chunk_rows=4096):
+        if columnar not in (None, "npz", "parquet"):
+            raise ValueError("columnar must be None, 'npz' or 'parquet'")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.track = track
+        self.columnar = columnar
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows = 0
+
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(FIELDNAMES)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+        # Columnar output: rows are packed into fixed-size typed chunks (a few bytes per row)
+        self._chunk_rows = chunk_rows
+        self._chunks = []
+        self._chunk = None
+        self._parquet = None
+
+    def record(self, state, action, reward, fatigue_score, track_index=None):
+        ''' Append a step. track_index is the runner's point on the track (RunnerEnv.track_index); without it the
+        n-th row takes the n-th point, like utils.save_training_session did.'''
+        i = self.rows if track_index is None else track_index
+        if self.track is not None and i < len(self.track):
+            lat, lon, elevation = float(self.track.lat[i]), float(self.track.lon[i]), float(self.track.elevation[i])
+            if elevation != elevation:  # NaN, no elevation
+                elevation = None
+        else:
+            lat = lon = elevation = None
+
+        row = (state['segment_index'], state['phase_label'], action, reward, state['fatigue_level'],
+               state['HR_zone'], state['power_zone'], state['target_hr_zone'], state['target_power_zone'],
+               fatigue_score, None, state['slope_level'], lat, lon, elevation)
+        self._buffer.append(row)
+        if self.columnar:
+            self._append_columns(row)
+        self.rows += 1
+
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        ''' Write the buffered rows to the CSV file and flush it to the OS.'''
+        self._writer.writerows(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def _append_columns(self, row):
+        chunk = self._chunk
+        if chunk is None or chunk['n'] == self._chunk_rows:
+            chunk = self._new_chunk()
+        n = chunk['n']
+        for name, value in zip(FIELDNAMES, row):
+            if name in _CODES:
+                chunk[name][n] = _CODES[name][value]
+            elif name in DTYPES:
+                chunk[name][n] = np.nan if value is None else value
+        chunk['n'] = n + 1
+
+    def _new_chunk(self):
+        if self._chunk is not None:
+            self._close_chunk(self._chunk)
+        self._chunk = {name: np.empty(self._chunk_rows, dtype=DTYPES.get(name, np.int8)) for name in COLUMNS}
+        self._chunk['n'] = 0
+        return self._chunk
+
+    def _close_chunk(self, chunk):
+        columns = {name: chunk[name][:chunk['n']] for name in COLUMNS}
+        if self.columnar == "parquet":
+            # Parquet is written as it goes, one row group per chunk
+            table = _arrow_table(columns)
+            if self._parquet is None:
+                import pyarrow.parquet as pq
+                self._parquet = pq.ParquetWriter(self.columnar_path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            self._chunks.append(columns)
+
+    @property
+    def columnar_path(self):
+        return os.path.splitext(self.path)[0] + "." + self.columnar if self.columnar else None
+
+    def close(self):
+        ''' Flush and close the CSV and write the columnar file. Returns the paths written.'''
+        self.flush()
+        self._file.close()
+        paths = [self.path]
+        if self.columnar:
+            if self._chunk is not None and self._chunk['n']:
+                self._close_chunk(self._chunk)
+            self._chunk = None
+            if self.columnar == "parquet":
+                if self._parquet is not None:
+                    self._parquet.close()
+            else:
+                columns = {name: np.concatenate([c[name] for c in self._chunks]) if self._chunks
+                           else np.empty(0, dtype=DTYPES.get(name, np.int8)) for name in COLUMNS}
+                vocabularies = {f"{name}__labels": np.array(vocab) for name, vocab in VOCABULARIES.items()}
+                np.savez(self.columnar_path, **columns, **vocabularies)
+            paths.append(self.columnar_path)
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _arrow_table(columns):
+    import pyarrow as pa
+    arrays, names = [], []
+    for name in COLUMNS:
+        if name in VOCABULARIES:
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(columns[name]), pa.array(VOCABULARIES[name])))
+        else:
+            arrays.append(pa.array(columns[name]))
+        names.append(name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def load_session(path):
+    ''' DataFrame of a session log: CSV, .npz or .parquet. In the columnar formats the categorical fields are loaded as
+    pandas Categoricals of their labels (same values of the CSV, without parsing them).'''
+    import pandas as pd
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path)
+    if ext == ".parquet":
+        df = pd.read_parquet(path)
+    elif ext == ".npz":
+        with np.load(path) as data:
+            df = pd.DataFrame({
+                name: pd.Categorical.from_codes(data[name], categories=data[f"{name}__labels"].tolist())
+                if name in VOCABULARIES else data[name]
+                for name in COLUMNS
+            })
+    else:
+        raise ValueError(f"unknown session log format: {path}")
+    df.insert(FIELDNAMES.index('fatigue_level'), 'fatigue_level', np.nan)
+    return df
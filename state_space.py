@@ -0,0 +1,114 @@
+'''
+Integer encoding of the RunnerEnv state space.
+A state key is the 7-tuple (HR zone, power zone, fatigue level, phase, target HR zone, target power zone, slope level)
+used by the Q-tables. Every component is categorical, so the whole tuple can be mapped (mixed radix) to a single index
+in [0, N_STATES) and a Q-table becomes a dense float[N_STATES, len(ACTIONS)] array.
+The helpers below convert between the JSON Q-tables ({"(key tuple)": {action: value}}) and the dense arrays, keeping a
+`visited` mask so that only the states actually seen in training are written back.
+'''
+
+import json
+from ast import literal_eval
+
+import numpy as np
+
+from runner_env import ACTIONS, ZONES, FATIGUE_LEVELS, PHASES, SLOPES
+
+# Vocabulary of every component of the state key, in key order
+STATE_COMPONENTS = [ZONES, ZONES, FATIGUE_LEVELS, PHASES, ZONES, ZONES, SLOPES]
+STATE_SHAPE = tuple(len(values) for values in STATE_COMPONENTS)
+N_STATES = int(np.prod(STATE_SHAPE))
+N_ACTIONS = len(ACTIONS)
+
+_ZONE = {z: i for i, z in enumerate(ZONES)}
+_FATIGUE = {f: i for i, f in enumerate(FATIGUE_LEVELS)}
+_PHASE = {p: i for i, p in enumerate(PHASES)}
+_SLOPE = {s: i for i, s in enumerate(SLOPES)}
+_INDEXES = [_ZONE, _ZONE, _FATIGUE, _PHASE, _ZONE, _ZONE, _SLOPE]
+_NZ, _NF, _NP, _NS = len(ZONES), len(FATIGUE_LEVELS), len(PHASES), len(SLOPES)
+
+
+def encode_state(state):
+    ''' Index of a RunnerEnv state dict (same components of get_state_key).'''
+    i = _ZONE[state['HR_zone']]
+    i = i * _NZ + _ZONE[state['power_zone']]
+    i = i * _NF + _FATIGUE[state['fatigue_level']]
+    i = i * _NP + _PHASE[state['phase_label']]
+    i = i * _NZ + _ZONE[state['target_hr_zone']]
+    i = i * _NZ + _ZONE[state['target_power_zone']]
+    return i * _NS + _SLOPE[state['slope_level']]
+
+
+def encode_key(key):
+    ''' Index of a state key tuple, as stored in the JSON Q-tables.'''
+    i = 0
+    for value, size, index in zip(key, STATE_SHAPE, _INDEXES):
+        i = i * size + index[value]
+    return i
+
+
+def decode_index(index):
+    ''' State key tuple of an index, inverse of encode_key.'''
+    codes = np.unravel_index(index, STATE_SHAPE)
+    return tuple(values[int(c)] for values, c in zip(STATE_COMPONENTS, codes))
+
+
+def encode_batch(state):
+    ''' Vectorized encoding of the integer-coded states returned by VecRunnerEnv (zones are 1..5).'''
+    return np.ravel_multi_index((
+        state['HR_zone'] - 1, state['power_zone'] - 1, state['fatigue_level'], state['phase_label'],
+        state['target_hr_zone'] - 1, state['target_power_zone'] - 1, state['slope_level']
+    ), STATE_SHAPE)
+
+
+def new_qtable(dtype=np.float32):
+    ''' Empty dense Q-table and its visited mask.'''
+    return np.zeros((N_STATES, N_ACTIONS), dtype=dtype), np.zeros(N_STATES, dtype=bool)
+
+
+def flat_view(table):
+    ''' Flat memoryview over a dense table: entry (state, action) is at state * N_ACTIONS + action.
+    Reading and writing single entries through it returns plain Python floats, which in the per-step training loop
+    is several times faster than indexing the ndarray (no NumPy scalar boxing).'''
+    return memoryview(table.reshape(-1))
+
+
+def greedy_action(q, index):
+    ''' Greedy action index of a state on a flat_view; ties go to the first action, like max() over the dict tables.'''
+    b = index * N_ACTIONS
+    slow, keep, accelerate = q[b], q[b + 1], q[b + 2]
+    if slow >= keep and slow >= accelerate:
+        return 0
+    return 1 if keep >= accelerate else 2
+
+
+def qtable_from_dict(Q, dtype=np.float32):
+    ''' Dense table from a dict Q-table ({key tuple or its str: {action: value}}).
+    The conversion is exact with dtype=np.float64; float32 keeps the precision used in training.'''
+    table, visited = new_qtable(dtype)
+    for key, values in Q.items():
+        if isinstance(key, str):
+            key = literal_eval(key)
+        i = encode_key(key)
+        table[i] = [values[act] for act in ACTIONS]
+        visited[i] = True
+    return table, visited
+
+
+def qtable_to_dict(table, visited):
+    ''' Dict Q-table (key tuple -> {action: value}) of the visited states of a dense table.'''
+    return {
+        decode_index(i): {act: float(v) for act, v in zip(ACTIONS, table[i])}
+        for i in np.flatnonzero(visited)
+    }
+
+
+def load_qtable_array(path, dtype=np.float32):
+    with open(path) as f:
+        return qtable_from_dict(json.load(f), dtype)
+
+
+def save_qtable_array(path, table, visited):
+    ''' Write a dense table in the JSON format read by utils.load_qtable.'''
+    with open(path, 'w') as f:
+        json.dump({str(k): v for k, v in qtable_to_dict(table, visited).items()}, f, indent=2)
@@ -0,0 +1,253 @@
+'''
+On-disk cache of the basemap tiles of the videos.
+Tiles are stored as data/tiles/<provider>/<z>/<x>/<y>.png and only downloaded the first time they are needed; the
+cache is bounded in size and evicts the least recently used tiles (a hit refreshes the file's mtime).
+
+The basemap of a map extent is composited once from its tiles and saved as an image next to them (composites/),
+so every video of the same circuit reuses the same image instead of fetching and stitching the tiles again.
+In offline mode (offline=True, or SMARTPACER_TILES_OFFLINE=1) nothing is downloaded: a missing tile is an error,
+which `python tile_cache.py seed` prevents by fetching the tiles of all the circuits in advance.
+
+    python tile_cache.py seed --zooms 1     # basemaps of the videos, plus one more zoom level
+    python tile_cache.py stats
+    python tile_cache.py prune --max-mb 100
+'''
+
+import os
+import io
+import time
+import argparse
+import urllib.request
+
+import numpy as np
+
+TILES_DIR = "data/tiles"
+MAX_CACHE_MB = 512
+USER_AGENT = "smart-pacer/1.0 (basemap tile cache)"
+WEB_MERCATOR_RADIUS = 6378137.0  # EPSG:3857, the projection of the basemap tiles
+HALF_WORLD = np.pi * WEB_MERCATOR_RADIUS
+PROVIDERS = {
+    "osm": {"url": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+            "attribution": "(C) OpenStreetMap contributors", "max_zoom": 19},
+}
+DEFAULT_PROVIDER = "osm"
+
+_COMPOSITES = {}  # composites already loaded by this process
+
+
+class TileMissing(LookupError):
+    ''' A tile is not in the cache and the cache is offline.'''
+
+
+def web_mercator(lat, lon):
+    ''' Project WGS84 degrees to Web Mercator meters (EPSG:3857).'''
+    x = WEB_MERCATOR_RADIUS * np.radians(lon)
+    y = WEB_MERCATOR_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def to_lonlat(x, y):
+    ''' Inverse of web_mercator.'''
+    lon = np.degrees(x / WEB_MERCATOR_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(y / WEB_MERCATOR_RADIUS)) - np.pi / 2)
+    return lon, lat
+
+
+def auto_zoom(extent, max_zoom=19):
+    ''' Zoom level whose tiles suit a map extent (xmin, xmax, ymin, ymax) in Web Mercator meters, like contextily.'''
+    w, s = to_lonlat(extent[0], extent[2])
+    e, n = to_lonlat(extent[1], extent[3])
+    zoom = max(np.ceil(np.log2(720.0 / (e - w))), np.ceil(np.log2(720.0 / (n - s))))
+    return int(min(zoom, max_zoom))
+
+
+def tile_range(extent, zoom):
+    ''' Tiles (x0, y0, x1, y1), bounds included, covering a Web Mercator extent at a zoom level.'''
+    n = 2 ** zoom
+    size = 2 * HALF_WORLD / n
+    x0 = int((extent[0] + HALF_WORLD) // size)
+    x1 = int((extent[1] + HALF_WORLD) // size)
+    y0 = int((HALF_WORLD - extent[3]) // size)   # tile rows grow southwards
+    y1 = int((HALF_WORLD - extent[2]) // size)
+    clip = lambda v: min(max(v, 0), n - 1)
+    return clip(x0), clip(y0), clip(x1), clip(y1)
+
+
+def tiles_extent(x0, y0, x1, y1, zoom):
+    ''' Web Mercator extent (xmin, xmax, ymin, ymax) of a block of tiles.'''
+    size = 2 * HALF_WORLD / 2 ** zoom
+    return (x0 * size - HALF_WORLD, (x1 + 1) * size - HALF_WORLD,
+            HALF_WORLD - (y1 + 1) * size, HALF_WORLD - y0 * size)
+
+
+class TileCache:
+    def __init__(self, root=TILES_DIR, max_mb=MAX_CACHE_MB, offline=None):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.offline = os.environ.get("SMARTPACER_TILES_OFFLINE") == "1" if offline is None else offline
+        self.hits = self.downloads = self.evicted = 0
+        self._size = None  # bytes on disk, measured on the first write
+
+    def tile_path(self, provider, z, x, y):
+        return os.path.join(self.root, provider, str(z), str(x), f"{y}.png")
+
+    def get(self, provider, z, x, y):
+        ''' Bytes of a tile, from the cache or downloaded (and cached).'''
+        path = self.tile_path(provider, z, x, y)
+        if os.path.exists(path):
+            self.hits += 1
+            os.utime(path)  # mark as recently used
+            with open(path, "rb") as f:
+                return f.read()
+        if self.offline:
+            raise TileMissing(f"tile {provider}/{z}/{x}/{y} is not cached (offline mode): "
+                              f"run `python tile_cache.py seed` on a host with network access")
+        data = self._download(PROVIDERS[provider]["url"].format(z=z, x=x, y=y))
+        self.downloads += 1
+        self._store(path, data)
+        return data
+
+    def _download(self, url, attempts=3):
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        for attempt in range(attempts):
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.read()
+            except OSError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _store(self, path, data):
+        ''' Write a file atomically and evict the least recently used files if the cache grew over its bound.'''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._files())
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.prune(keep=path)
+
+    def _files(self):
+        ''' (mtime, size, path) of every file of the cache.'''
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def prune(self, max_bytes=None, keep=None):
+        ''' Remove the least recently used files until the cache is within 90% of its bound.'''
+        target = 0.9 * (self.max_bytes if max_bytes is None else max_bytes)
+        files = sorted(self._files())
+        size = sum(size for _, size, _ in files)
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            self.evicted += 1
+        self._size = size
+        return size
+
+    def composite(self, extent, zoom, provider=DEFAULT_PROVIDER):
+        ''' RGB image of the tiles covering `extent` at `zoom`, and its own Web Mercator extent. Built once from the
+        tiles and saved in composites/, then reused (from memory within a process).'''
+        block = tile_range(extent, zoom)
+        key = f"{provider}-{zoom}-" + "-".join(map(str, block))
+        if key in _COMPOSITES:
+            return _COMPOSITES[key]
+        path = os.path.join(self.root, "composites", key + ".npy")
+        if os.path.exists(path):
+            os.utime(path)
+            image = np.load(path)
+        else:
+            from PIL import Image  # matplotlib dependency
+            x0, y0, x1, y1 = block
+            rows = []
+            for y in range(y0, y1 + 1):
+                rows.append(np.hstack([np.asarray(Image.open(io.BytesIO(self.get(provider, zoom, x, y))).convert("RGB"))
+                                       for x in range(x0, x1 + 1)]))
+            image = np.vstack(rows)
+            buffer = io.BytesIO()
+            np.save(buffer, image)
+            self._store(path, buffer.getvalue())
+        _COMPOSITES[key] = image, tiles_extent(*block, zoom)
+        return _COMPOSITES[key]
+
+    def seed(self, extent, zooms, provider=DEFAULT_PROVIDER):
+        ''' Download the missing tiles of an extent at the given zoom levels. Returns the number of tiles.'''
+        count = 0
+        for zoom in zooms:
+            x0, y0, x1, y1 = tile_range(extent, zoom)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.get(provider, zoom, x, y)
+                    count += 1
+        return count
+
+    def stats(self):
+        files = list(self._files())
+        return {"files": len(files), "mb": sum(size for _, size, _ in files) / 1024 / 1024,
+                "hits": self.hits, "downloads": self.downloads, "evicted": self.evicted}
+
+
+def add_basemap(ax, cache=None, provider=DEFAULT_PROVIDER, zoom=None):
+    ''' Draw the cached basemap under the current limits of `ax` (in Web Mercator meters), like ctx.add_basemap.'''
+    cache = cache or TileCache()
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    extent = (xmin, xmax, ymin, ymax)
+    if zoom is None:
+        zoom = auto_zoom(extent, PROVIDERS[provider]["max_zoom"])
+    image, image_extent = cache.composite(extent, zoom, provider)
+    ax.imshow(image, extent=image_extent, origin="upper", interpolation="bilinear", zorder=0)
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.text(0.005, 0.005, PROVIDERS[provider]["attribution"], transform=ax.transAxes, fontsize=6, ha="left", va="bottom")
+
+
+def seed_circuits(cache, provider=DEFAULT_PROVIDER, extra_zooms=0):
+    ''' Seed the tiles (and composites) of the video basemap of every circuit in data/maps.'''
+    from track_store import MAPS_DIR
+    from training_visualizer import circuit_extent
+
+    circuits = sorted(os.path.splitext(f)[0] for f in os.listdir(MAPS_DIR) if f.endswith(".json"))
+    for circuit_name in circuits:
+        extent = circuit_extent(circuit_name)
+        zoom = auto_zoom(extent, PROVIDERS[provider]["max_zoom"])
+        zooms = range(zoom, min(zoom + extra_zooms, PROVIDERS[provider]["max_zoom"]) + 1)
+        n = cache.seed(extent, zooms, provider)
+        cache.composite(extent, zoom, provider)
+        print(f"🗺️  {circuit_name}: {n} tiles at zoom {zooms[0]}-{zooms[-1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Basemap tile cache of the videos")
+    parser.add_argument("command", choices=("seed", "stats", "prune"))
+    parser.add_argument("--root", default=TILES_DIR)
+    parser.add_argument("--provider", default=DEFAULT_PROVIDER, choices=sorted(PROVIDERS))
+    parser.add_argument("--zooms", type=int, default=0, help="zoom levels to seed beyond the one of the videos")
+    parser.add_argument("--max-mb", type=float, default=MAX_CACHE_MB, help="size bound of the cache")
+    args = parser.parse_args()
+
+    cache = TileCache(args.root, args.max_mb, offline=False)
+    if args.command == "seed":
+        seed_circuits(cache, args.provider, args.zooms)
+    elif args.command == "prune":
+        cache.prune()
+    stats = cache.stats()
+    print(f"📦 {stats['files']} files, {stats['mb']:.1f} MB ({stats['downloads']} downloaded, "
+          f"{stats['evicted']} evicted)")
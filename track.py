@@ -1,60 +1,168 @@
 '''
-This file reads a GPX (GPS Exchange Format) and processes its track data to extract detailed information about each GPS point. 
+This file reads a GPX (GPS Exchange Format) and processes its track data to extract detailed information about each GPS point.
 For each point, it extracts latitude, longitude, elevation, and timestamp and calculates distance between two points using the haversine formula, computes the time difference in seconds, and derives the speed in meters per second. Extracts also elevation and slope.
+
+The GPX is read in streaming (iterparse), releasing every track point once read, so the parser memory does not grow with
+the length of the recording: points are collected in chunks of plain arrays, and distances, speeds and slopes are
+computed in bulk with NumPy. From the command line it converts a single GPX or a whole directory of GPX files in parallel:
+
+    python track.py data/maps --workers 4
 '''
 
-import gpxpy
-from utils import haversine, slope_level, save_to_json
+import os
+import glob
+import argparse
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def parse_gpx(file_path):
-    with open(file_path, 'r') as gpx_file:
-        gpx = gpxpy.parse(gpx_file)
+import numpy as np
+
+from utils import save_to_json
+from track_store import Track, haversine_array, slope_codes, write_track
+from runner_env import SLOPES
+
+NO_TIME = np.iinfo(np.int64).min  # missing timestamp (microseconds since epoch)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _to_us(text):
+    t = datetime.fromisoformat(text.strip())
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return (t - EPOCH) // timedelta(microseconds=1)
+
+
+def iter_gpx_chunks(file_path, chunk_size=65536):
+    ''' Stream the track points of a GPX file as chunks of arrays (lat, lon, elevation, time in µs since epoch).
+    Points of every track and segment are concatenated, like in the recording.'''
+    lat, lon, ele, tim = [], [], [], []
+    point_ele = point_time = None
+    segment = None
+
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "trkseg":
+                segment = elem
+            elif tag == "trkpt":
+                point_ele = point_time = None
+            continue
+
+        if tag == "ele":
+            point_ele = elem.text
+        elif tag == "time":
+            point_time = elem.text
+        elif tag == "trkpt":
+            lat.append(float(elem.get("lat")))
+            lon.append(float(elem.get("lon")))
+            ele.append(float(point_ele) if point_ele else np.nan)
+            tim.append(_to_us(point_time) if point_time else NO_TIME)
+            # the point has been read: drop it (and the already read siblings) from the tree
+            if segment is not None:
+                segment.clear()
+            if len(lat) >= chunk_size:
+                yield np.array(lat), np.array(lon), np.array(ele), np.array(tim, dtype=np.int64)
+                lat, lon, ele, tim = [], [], [], []
+
+    if lat:
+        yield np.array(lat), np.array(lon), np.array(ele), np.array(tim, dtype=np.int64)
 
-    data = []
-    last_point = None
-
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                entry = {
-                    "lat": point.latitude,
-                    "lon": point.longitude,
-                    "elevation": point.elevation,
-                    "time": point.time.isoformat() if point.time else None
-                }
-
-                if last_point:
-                    dist = haversine(
-                        last_point.latitude, last_point.longitude,
-                        point.latitude, point.longitude
-                    )
-                    if point.time and last_point.time:
-                        delta_t = (point.time - last_point.time).total_seconds()
-                        entry["delta_time"] = delta_t
-                        entry["speed_mps"] = dist / delta_t if delta_t > 0 else 0.0
-                    else:
-                        entry["delta_time"] = None
-                        entry["speed_mps"] = None
-
-                    delta_elev = point.elevation - last_point.elevation
-                    entry["slope"] = slope_level(delta_elev)
-                else:
-                    entry["delta_time"] = None
-                    entry["speed_mps"] = None
-                    entry["slope"] = "flat"
-
-                last_point = point
-                data.append(entry)
 
+def read_gpx(file_path, chunk_size=65536):
+    ''' Columns of a GPX track: lat, lon, elevation, time (µs), delta_time (s), speed_mps, slope (code).
+    Deltas of the first point are NaN and its slope is flat.'''
+    chunks = {k: [] for k in ("lat", "lon", "elevation", "time", "distance", "delta_time", "speed_mps", "slope")}
+    prev = None  # last point of the previous chunk
+
+    for lat, lon, ele, tim in iter_gpx_chunks(file_path, chunk_size):
+        if prev is None:
+            p_lat, p_lon, p_ele, p_tim = lat[:-1], lon[:-1], ele[:-1], tim[:-1]
+            head = 1
+        else:
+            p_lat, p_lon, p_ele, p_tim = (np.concatenate(([p], a[:-1])) for p, a in zip(prev, (lat, lon, ele, tim)))
+            head = 0
+
+        dist = haversine_array(p_lat, p_lon, lat[head:], lon[head:])
+        has_time = (p_tim != NO_TIME) & (tim[head:] != NO_TIME)
+        delta_t = np.where(has_time, (tim[head:] - p_tim) / 1e6, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speed = np.where(delta_t > 0, dist / delta_t, 0.0)
+        speed[~has_time] = np.nan
+        slope = slope_codes(ele[head:] - p_ele)
+
+        if head:
+            dist, delta_t, speed, slope = (np.concatenate(([first], a)) for first, a in
+                                           zip((0.0, np.nan, np.nan, SLOPES.index("flat")), (dist, delta_t, speed, slope)))
+        for key, values in zip(chunks, (lat, lon, ele, tim, dist, delta_t, speed, slope.astype(np.int8))):
+            chunks[key].append(values)
+        prev = (lat[-1], lon[-1], ele[-1], tim[-1])
+
+    columns = {k: np.concatenate(v) if v else np.array([]) for k, v in chunks.items()}
+    columns["slope"] = columns["slope"].astype(np.int8)
+    return columns
+
+
+def columns_to_track(columns):
+    return Track(columns["lat"], columns["lon"], columns["elevation"], columns["slope"],
+                 distance=np.cumsum(columns["distance"]))
+
+
+def columns_to_points(columns):
+    ''' List of point dicts, the JSON format of data/maps.'''
+    def opt(x):
+        return None if np.isnan(x) else x
+
+    data = []
+    for lat, lon, ele, tim, dt, speed, slope in zip(
+            columns["lat"].tolist(), columns["lon"].tolist(), columns["elevation"].tolist(), columns["time"].tolist(),
+            columns["delta_time"].tolist(), columns["speed_mps"].tolist(), columns["slope"].tolist()):
+        data.append({
+            "lat": lat,
+            "lon": lon,
+            "elevation": opt(ele),
+            "time": (EPOCH + timedelta(microseconds=tim)).isoformat() if tim != NO_TIME else None,
+            "delta_time": opt(dt),
+            "speed_mps": opt(speed),
+            "slope": SLOPES[slope],
+        })
     return data
 
 
+def parse_gpx(file_path):
+    return columns_to_points(read_gpx(file_path))
+
+
+def convert_gpx(gpx_file, out_dir=None):
+    ''' Write the .trk track and the JSON export of a GPX file, named after it. Returns (name, number of points).'''
+    name = os.path.splitext(os.path.basename(gpx_file))[0]
+    base = os.path.join(out_dir or os.path.dirname(gpx_file), name)
+    columns = read_gpx(gpx_file)
+    write_track(columns_to_track(columns), base + ".trk")
+    save_to_json(columns_to_points(columns), base + ".json")
+    return name, len(columns["lat"])
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert GPX files to the .trk and JSON track formats")
+    parser.add_argument("source", help="a GPX file or a directory of GPX files")
+    parser.add_argument("--out", help="output directory (default: next to the GPX files)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    args = parser.parse_args()
 
-    circuit = "tre_laghi"                       # Define the name of the circuit
-    gpx_file = f"data/maps/{circuit}.GPX"       # Name of the gpx file
-    output_path = f"data/maps/{circuit}.json"   # Output file
-    data = parse_gpx(gpx_file)                  # Parse the GPX file
+    if os.path.isdir(args.source):
+        files = sorted(f for f in glob.glob(os.path.join(args.source, "*")) if f.lower().endswith(".gpx"))
+    else:
+        files = [args.source]
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
 
-    elevations = [p["elevation"] for p in data if p["elevation"] is not None]
-    save_to_json(data, output_path)
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(files)))) as pool:
+        futures = {pool.submit(convert_gpx, f, args.out): f for f in files}
+        for future in as_completed(futures):
+            name, n = future.result()
+            print(f"✅ {name}: {n} points")
@@ -0,0 +1,215 @@
+'''
+Columnar binary format for the running circuits.
+The JSON files in data/maps store one dict per GPS point; the environment only needs the slope of a point, while the
+visualizer and the session logs need the coordinates. A .trk file stores the same track as columns:
+
+    lat, lon, elevation, distance   float64   (distance is the cumulative distance in meters from the first point)
+    slope                           int8      (index into runner_env.SLOPES)
+
+Layout: 8 bytes magic, uint32 header length, JSON header (number of points, dtype and offset of every column),
+then the columns, each one 8-byte aligned. Columns are memory-mapped on load, so opening a track costs a few syscalls
+and the data is only paged in when read. The JSON files stay available as an export (see export_json).
+load_track reads the JSON instead when it is newer than the .trk file (`python track_store.py` rebuilds them).
+'''
+
+import os
+import json
+import struct
+from bisect import bisect_right
+
+import numpy as np
+
+from runner_env import SLOPES
+
+MAGIC = b"SPTRK01\0"
+COLUMNS = [("lat", "<f8"), ("lon", "<f8"), ("elevation", "<f8"), ("distance", "<f8"), ("slope", "i1")]
+MAPS_DIR = "data/maps"
+EARTH_RADIUS = 6371000  # meters, same of utils.haversine
+BUCKET_SIZE = 0.5       # meters, resolution of the distance -> point lookup table of Track.indexes_at
+
+
+def haversine_array(lat1, lon1, lat2, lon2):
+    ''' Vectorized utils.haversine: great-circle distance in meters between arrays of points in decimal degrees.'''
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+
+
+def slope_codes(delta_elev):
+    ''' Vectorized utils.slope_level: slope code (index into SLOPES) of each elevation change. NaN is flat.'''
+    codes = np.zeros(len(delta_elev), dtype=np.int8)
+    codes[delta_elev > 0.5] = SLOPES.index("uphill")
+    codes[delta_elev < -0.5] = SLOPES.index("downhill")
+    return codes
+
+
+def cumulative_distance(lat, lon):
+    dist = np.zeros(len(lat))
+    if len(lat) > 1:
+        np.cumsum(haversine_array(lat[:-1], lon[:-1], lat[1:], lon[1:]), out=dist[1:])
+    return dist
+
+
+class Track:
+    ''' Columns of a circuit. Indexing returns the point as a dict (lat, lon, elevation, slope), like the JSON tracks,
+    so a Track can be used wherever a list of points was.'''
+
+    def __init__(self, lat, lon, elevation, slope, distance=None, path=None):
+        self.lat = lat
+        self.lon = lon
+        self.elevation = elevation
+        self.slope = slope
+        self.distance = cumulative_distance(lat, lon) if distance is None else distance
+        self.path = path
+        self._distance_list = None
+        self._lap_length = None
+        self._buckets = None
+
+    def __len__(self):
+        return len(self.slope)
+
+    def __getitem__(self, i):
+        return {
+            "lat": float(self.lat[i]),
+            "lon": float(self.lon[i]),
+            "elevation": None if np.isnan(self.elevation[i]) else float(self.elevation[i]),
+            "slope": SLOPES[self.slope[i]],
+        }
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __reduce__(self):
+        # Memory-mapped tracks are sent to worker processes by path, not by value
+        if self.path is not None:
+            return (read_track, (self.path,))
+        return (Track, (self.lat, self.lon, self.elevation, self.slope, self.distance))
+
+    def slope_labels(self):
+        return [SLOPES[c] for c in self.slope.tolist()]
+
+    @property
+    def lap_length(self):
+        ''' Length of one lap in meters: the track plus the closing segment from the last point back to the first.'''
+        if self._lap_length is None:
+            closing = haversine_array(self.lat[-1], self.lon[-1], self.lat[0], self.lon[0]) if len(self) > 1 else 0.0
+            self._lap_length = float(self.distance[-1] + closing) if len(self) else 0.0
+        return self._lap_length
+
+    def index_at(self, distance):
+        ''' Index of the track point reached after running `distance` meters from the start, wrapping around the
+        circuit when the distance is longer than a lap. O(log n) bisect over the cumulative distances.'''
+        if self._distance_list is None:
+            self._distance_list = self.distance.tolist()
+        lap = self.lap_length
+        if lap > 0:
+            distance %= lap
+        return max(0, bisect_right(self._distance_list, distance) - 1)
+
+    def indexes_at(self, distances):
+        ''' Vectorized index_at for an array of distances.
+        A batched searchsorted with random queries is slow (a cache miss per probe), so the lookup goes through a
+        table of the point index at every BUCKET_SIZE meters, then moves forward over the few points that can share
+        a bucket.'''
+        if self._buckets is None:
+            n_buckets = int(self.lap_length / BUCKET_SIZE) + 2
+            edges = np.arange(n_buckets) * BUCKET_SIZE
+            self._buckets = np.maximum(np.searchsorted(self.distance, edges, side="right") - 1, 0)
+            self._next_distance = np.append(np.asarray(self.distance)[1:], np.inf)
+        lap = self.lap_length
+        if lap > 0:
+            distances = distances - lap * np.floor(distances / lap)  # much faster than np.mod
+        index = self._buckets.take((distances / BUCKET_SIZE).astype(np.int64))
+        active = np.flatnonzero(self._next_distance.take(index) <= distances)
+        while active.size:
+            index[active] += 1
+            active = active[self._next_distance[index[active]] <= distances[active]]
+        return index
+
+
+def track_from_points(points):
+    ''' Track from a list of point dicts (the JSON format produced by track.parse_gpx).'''
+    def column(key, default):
+        return np.array([default if p.get(key) is None else p[key] for p in points], dtype=np.float64)
+
+    slope = np.array([SLOPES.index(p.get("slope", "flat")) for p in points], dtype=np.int8)
+    return Track(column("lat", np.nan), column("lon", np.nan), column("elevation", np.nan), slope)
+
+
+def write_track(track, path):
+    ''' Write a Track as a .trk file.'''
+    n = len(track)
+    arrays = {name: np.ascontiguousarray(getattr(track, name), dtype=dtype) for name, dtype in COLUMNS}
+    header = {"n": n, "slopes": SLOPES, "columns": {}}
+
+    # The header size depends on the offsets it contains: reserve it generously, then place the columns after it
+    header_size = 1024
+    offset = len(MAGIC) + 4 + header_size
+    for name, dtype in COLUMNS:
+        header["columns"][name] = {"dtype": dtype, "offset": offset}
+        offset += arrays[name].nbytes
+        offset += -offset % 8
+    raw = json.dumps(header).encode()
+    assert len(raw) <= header_size
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", header_size) + raw.ljust(header_size, b" "))
+        for name, _ in COLUMNS:
+            f.seek(header["columns"][name]["offset"])
+            f.write(arrays[name].tobytes())
+        f.truncate(offset)
+
+
+def read_track(path):
+    ''' Memory-map a .trk file.'''
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a track file")
+        (header_size,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_size))
+    if header["slopes"] != SLOPES:
+        raise ValueError(f"{path} uses slope codes {header['slopes']}, expected {SLOPES}")
+
+    n = header["n"]
+    columns = {
+        name: np.memmap(path, dtype=col["dtype"], mode="r", offset=col["offset"], shape=(n,))
+        for name, col in header["columns"].items()
+    }
+    return Track(columns["lat"], columns["lon"], columns["elevation"], columns["slope"],
+                 distance=columns["distance"], path=path)
+
+
+def load_track(circuit, maps_dir=MAPS_DIR):
+    ''' Load a circuit by name (e.g. "Belfiore (MN)") or path. An explicit extension is honoured; otherwise the .trk
+    file is used if it is at least as recent as the JSON (like policy.load_or_compile), else the JSON.'''
+    base, ext = os.path.splitext(circuit)
+    if ext not in (".json", ".trk"):
+        base, ext = circuit, ""
+    if not os.path.exists(base + ".trk") and not os.path.exists(base + ".json"):
+        base = os.path.join(maps_dir, base)
+    trk_path, json_path = base + ".trk", base + ".json"
+    if ext == ".trk" or (ext == "" and os.path.exists(trk_path) and
+                         (not os.path.exists(json_path) or os.path.getmtime(trk_path) >= os.path.getmtime(json_path))):
+        return read_track(trk_path)
+    with open(json_path) as f:
+        return track_from_points(json.load(f))
+
+
+def export_json(track, path):
+    ''' Export a Track to the JSON list-of-points format.'''
+    with open(path, "w") as f:
+        json.dump(list(track), f, indent=2)
+
+
+if __name__ == "__main__":
+    # Convert the JSON circuits given on the command line (default: all of data/maps) to .trk files next to them
+    import sys
+    import glob
+
+    paths = sys.argv[1:] or glob.glob(os.path.join(MAPS_DIR, "*.json"))
+    for json_path in paths:
+        with open(json_path) as f:
+            track = track_from_points(json.load(f))
+        trk_path = json_path[:-5] + ".trk"
+        write_track(track, trk_path)
+        print(f"💾 {json_path} -> {trk_path} ({os.path.getsize(trk_path) / 1024:.0f} KB, {len(track)} points)")
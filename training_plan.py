@@ -0,0 +1,67 @@
+'''
+Compiled training plans.
+A training plan in data/trainings.json is a list of segments, some of them with sub_segments and a repeat count.
+Instead of expanding it into one entry per second, CompiledPlan flattens it into run-length segments
+(phase, target HR zone, target power zone) with their cumulative boundaries: the segment of any second is found with a
+bisect, or in O(1) when the caller passes the index of the previous lookup (the usual case while stepping the clock).
+Compiled plans are immutable and cached per training definition, so all the envs and resets share the same object.
+'''
+
+import json
+from bisect import bisect_right
+
+
+class CompiledPlan:
+    def __init__(self, segments):
+        runs, durations = [], []
+        for segment in segments:
+            repeat = segment.get("repeat", 1)
+            leaves = segment["sub_segments"] if "sub_segments" in segment else [segment]
+            for _ in range(repeat):
+                for leaf in leaves:
+                    duration = int(leaf["duration_min"] * 60)
+                    run = (leaf["phase"], leaf["target_hr_zone"], leaf["target_power_zone"])
+                    if duration <= 0:
+                        continue
+                    if runs and runs[-1] == run:
+                        durations[-1] += duration  # merge consecutive identical segments
+                    else:
+                        runs.append(run)
+                        durations.append(duration)
+
+        self.runs = tuple(runs)
+        self.durations = tuple(durations)
+        ends, total = [], 0
+        for d in durations:
+            total += d
+            ends.append(total)
+        self.ends = tuple(ends)
+        self.starts = (0,) + self.ends[:-1]
+        self.length = total  # seconds covered by the plan
+
+    def __len__(self):
+        return self.length
+
+    def run_index(self, second, hint=0):
+        ''' Index of the run containing `second` (which must be < length). If `second` falls in the run `hint` or in
+        the next one the answer is immediate, otherwise it is a bisect over the run boundaries.'''
+        if self.starts[hint] <= second < self.ends[hint]:
+            return hint
+        if hint + 1 < len(self.runs) and self.starts[hint + 1] <= second < self.ends[hint + 1]:
+            return hint + 1
+        return bisect_right(self.ends, second)
+
+    def at(self, second):
+        ''' (phase, target HR zone, target power zone) at a given second of the plan.'''
+        return self.runs[self.run_index(second)]
+
+
+_PLAN_CACHE = {}
+
+def compile_plan(training):
+    ''' Cached CompiledPlan of a training definition (a dict of data/trainings.json).'''
+    key = json.dumps(training["segments"], sort_keys=True)
+    plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        plan = _PLAN_CACHE[key] = CompiledPlan(training["segments"])
+    return plan
@@ -1,142 +1,215 @@
+'''
+Video of a training session on the map of the circuit: the runner's trail coloured by fatigue level, the current
+position and a box with the second, phase, action, fatigue and zones.
+
+Everything that depends only on the session is computed once before rendering: the projected points, the array of
+trail segments, the RGBA colour of every segment and the info string of every frame. The static part of the figure
+(basemap, from the tile cache, title, axes) is drawn once; then every frame only draws the trail segments added since the previous frame
+on top of the canvas, redraws the lines of the info box that changed, draws the runner over a saved copy of the
+pixels under it and hands the frame to ffmpeg. Rendering time is
+therefore linear in the session length (the old animate(i) rebuilt the whole trail at every frame).
+'''
+
 import os
-import glob
-import json
-
-import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import contextily as ctx
-from shapely.geometry import Point
-from matplotlib.animation import FuncAnimation
+import argparse
+import subprocess
+
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.transforms import Bbox
 
-from runner_env import load_json
+from session_recorder import load_session
+from track_store import load_track
+from tile_cache import TileCache, add_basemap, web_mercator
 
 # === CONFIG ===
 CSV_DIR       = "data/training_log_DEF_20062025"
-ATHLETES_JSON = "data/athletes.json"
-TRAININGS_JSON= "data/trainings.json"
-MAPS_DIR      = "data/maps"
 OUT_DIR       = "data/video/final_delivery"
 
-os.makedirs(OUT_DIR, exist_ok=True)
-
-athletes = load_json(ATHLETES_JSON)
-trainings = load_json(TRAININGS_JSON)
-map_files = glob.glob(os.path.join(MAPS_DIR, "*.json"))
-
-for profile_label, athlete in athletes.items():
-    for training_name, training in trainings.items():
-        print(f"  * Allenamento: {training_name}")
-        for map_path in map_files:
-            circuit_name = os.path.splitext(os.path.basename(map_path))[0]
-            print(f"    - Circuito: {circuit_name}", end=" ... ")
-    
-            csv_path     = os.path.join(CSV_DIR, f"{profile_label}_{training_name}_{circuit_name}.csv")
-            output_video = os.path.join(OUT_DIR,  f"{profile_label}_{training_name}_{circuit_name}.mp4")
-
-            print(csv_path)
-
-            # DataFrame and downsample
-            df = pd.read_csv(csv_path)
-            STEP = 2 #print every 2 steps, to reduce video size and speed up animation
-            df = df[df.second % STEP == 0].reset_index(drop=True)
-            df = df.dropna(subset=["lat", "lon", "fatigue"])
-
-            # Color map for fatigue levels
-            color_map = {"low":"green", "medium":"orange", "high":"red"}
-            df["color"] = df["fatigue"].map(color_map)
-
-            #GeodataFrame and projection
-            gdf = gpd.GeoDataFrame(
-                df,
-                geometry=[Point(xy) for xy in zip(df.lon, df.lat)],
-                crs="EPSG:4326" #this is the default WGS84 coordinate system
-            ).to_crs(epsg=3857) #apply projection for compatibility with basemaps
-            df["x"] = gdf.geometry.x
-            df["y"] = gdf.geometry.y
-
-            # Extract array vlaues
-            xs     = df["x"].values
-            ys     = df["y"].values
-            colors = df["color"].tolist()
-
-            #white padding for the video
-            pad = 0.1
-            x_pad = (xs.max() - xs.min()) * pad
-            y_pad = (ys.max() - ys.min()) * pad
-            x_min, x_max = xs.min() - x_pad, xs.max() + x_pad
-            y_min, y_max = ys.min() - y_pad, ys.max() + y_pad
-
-            #create figure 
-            fig, (ax_map, ax_text) = plt.subplots(
-                1, 2, figsize=(10, 12),
-                gridspec_kw={'width_ratios':[3,1]}
-            )
-            fig.suptitle(f"{profile_label} – {training_name} – {circuit_name}", fontsize=16)
-
-            ax_map.set_xlim(x_min, x_max)
-            ax_map.set_ylim(y_min, y_max)
-            ctx.add_basemap(ax_map, source=ctx.providers.OpenStreetMap.Mapnik)
-            ax_map.set_autoscale_on(False)
-
-            #draw the red dot and the lines 
-            scat, = ax_map.plot([], [], 'ro', label='Athlete')
-            line = LineCollection([], linewidths=2)
-            ax_map.add_collection(line)
-
-            # textbox on the right side
-            text_box = ax_text.text(
-                0.05, 0.95, "",
-                transform=ax_text.transAxes,
-                fontsize=9, va='top', family='monospace'
-            )
-            ax_text.axis('off')
-
-            def init():
-                scat.set_data([], [])
-                line.set_segments([])
-                text_box.set_text("")
-                return scat, line, text_box
-
-            def animate(i):
-                segs = [[[xs[j], ys[j]], [xs[j+1], ys[j+1]]] for j in range(i)]
-                line.set_segments(segs)
-                line.set_color(colors[:i])
-
-                # Correctly set as sequences
-                scat.set_data([xs[i]], [ys[i]])
-
-                row = df.iloc[i]
-                info = (
-                    f"Second: {int(row.second)}/{int(df.second.max())}\n"
-                    f"Phase:   {row.phase}\n"
-                    f"Action:  {row.action}\n"
-                    f"Fatigue: {row.fatigue}\n"
-                    f"HR Z:    {row.HR_zone}   Power Z: {row.power_zone}"
-                )
-                text_box.set_text(info)
-                return scat, line, text_box
-
-            frame_indices = list(range(0, len(df), 2))
-
-            #Animation with blit, which is a performance optimization
-            anim = FuncAnimation(
-                fig, animate,
-                frames=frame_indices,
-                init_func=init,
-                blit=True,
-                interval=100  # milli -> 10 fps
-            )
-
-            anim.save(
-                output_video,
-                writer='ffmpeg',
-                fps=10,
-                dpi=100,
-                metadata={'artist':'SmartPacer'},
-                bitrate=2000
-            )
-
-            plt.close(fig)
-            print("✅ Video saved:", output_video)
+RENDER_VERSION = 3  # bump when the look of the videos changes, so that render_farm renders them again
+STEP = 2          # keep every 2nd second of the log, to reduce video size and speed up animation
+FRAME_STEP = 2    # one frame every 2 kept rows
+FPS = 10
+STATE_CACHE_SIZE = 512  # distinct info boxes whose pixels are kept (a few tens of KB each)
+MAP_PAD = 0.1     # white padding around the track, as a fraction of its size
+COLOR_MAP = {"low": "green", "medium": "orange", "high": "red"}
+
+
+def map_extent(xs, ys, pad=MAP_PAD):
+    ''' Limits (xmin, xmax, ymin, ymax) of the map of a track, in Web Mercator meters.'''
+    x_pad = (xs.max() - xs.min()) * pad
+    y_pad = (ys.max() - ys.min()) * pad
+    return xs.min() - x_pad, xs.max() + x_pad, ys.min() - y_pad, ys.max() + y_pad
+
+
+def circuit_extent(circuit_name):
+    ''' Map limits of a whole circuit: the same for all its videos, so they share one basemap.'''
+    track = load_track(circuit_name)
+    return map_extent(*web_mercator(np.asarray(track.lat, float), np.asarray(track.lon, float)))
+
+
+def log_source(path):
+    ''' File actually read for a session log: the .npz copy of the CSV when there is one.'''
+    npz_path = os.path.splitext(path)[0] + ".npz"
+    return npz_path if os.path.exists(npz_path) else path
+
+
+def load_log(path, step=STEP):
+    ''' Session log (CSV, or the .npz copy when there is one) downsampled to one row every `step` seconds.'''
+    df = load_session(log_source(path))
+    df = df[df.second % step == 0].reset_index(drop=True)
+    return df.dropna(subset=["lat", "lon", "fatigue"]).reset_index(drop=True)
+
+
+class Frames:
+    ''' Per-session arrays of the animation: points, trail segments and their colours, frame rows and info texts.'''
+
+    def __init__(self, df, frame_step=FRAME_STEP):
+        self.xs, self.ys = web_mercator(df["lat"].to_numpy(float), df["lon"].to_numpy(float))
+        points = np.column_stack([self.xs, self.ys])
+        self.segments = np.stack([points[:-1], points[1:]], axis=1)             # segment j goes from point j to j+1
+        palette = {level: to_rgba(color) for level, color in COLOR_MAP.items()}
+        self.colors = np.array([palette[f] for f in df["fatigue"].tolist()])  # colour of segment j: fatigue at j
+        self.indices = np.arange(0, len(df), frame_step)
+
+        # Info box: the second changes at every frame, the other lines only when the state changes
+        self.last_second = int(df["second"].max())
+        rows = df.iloc[self.indices]
+        self.second_texts = [f"Second: {int(second)}/{self.last_second}" for second in rows["second"].tolist()]
+        self.state_texts = [
+            f"\nPhase:   {phase}\n"
+            f"Action:  {action}\n"
+            f"Fatigue: {fatigue}\n"
+            f"HR Z:    {hr}   Power Z: {power}"
+            for phase, action, fatigue, hr, power in zip(
+                rows["phase"].tolist(), rows["action"].tolist(), rows["fatigue"].tolist(),
+                rows["HR_zone"].tolist(), rows["power_zone"].tolist())
+        ]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+class FFmpegSink:
+    ''' Pipe raw RGBA frames to ffmpeg, encoding an MP4.'''
+
+    def __init__(self, path, width, height, fps=FPS, bitrate=2000):
+        self._proc = subprocess.Popen([
+            matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            "-vcodec", "libx264", "-pix_fmt", "yuv420p", "-b:v", f"{bitrate}k",
+            "-metadata", "artist=SmartPacer", "-f", "mp4", path,
+        ], stdin=subprocess.PIPE)
+
+    def write(self, rgba):
+        self._proc.stdin.write(rgba)
+
+    def close(self):
+        self._proc.stdin.close()
+        if self._proc.wait():
+            raise RuntimeError(f"ffmpeg exited with code {self._proc.returncode}")
+
+
+def render_video(df, title, output_video, basemap=True, dpi=100, bitrate=2000, sink=None, tiles=None, extent=None):
+    ''' Render the video of a session log. `sink` (anything with write(rgba) and close()) replaces the ffmpeg
+    encoder, e.g. to time the rendering alone; `tiles` is the TileCache of the basemap (default: data/tiles);
+    `extent` the map limits (default: around the trail; circuit_extent to share the basemap of the circuit).
+    Returns the number of frames.'''
+    frames = Frames(df)
+    xs, ys = frames.xs, frames.ys
+
+    # create figure
+    fig = Figure(figsize=(10, 12), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax_map, ax_text = fig.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]})
+    fig.suptitle(title, fontsize=16)
+
+    # white padding for the video
+    xmin, xmax, ymin, ymax = extent or map_extent(xs, ys)
+    ax_map.set_xlim(xmin, xmax)
+    ax_map.set_ylim(ymin, ymax)
+    if basemap:
+        add_basemap(ax_map, tiles or TileCache())
+    ax_map.set_autoscale_on(False)
+    ax_text.axis('off')
+
+    # Animated artists are left out of the static draw and drawn by hand at every frame
+    dot, = ax_map.plot([], [], 'ro', label='Athlete', animated=True)
+    trail = LineCollection([], linewidths=2, animated=True)
+    ax_map.add_collection(trail)
+    second_box, state_box = (ax_text.text(0.05, 0.95, "", transform=ax_text.transAxes,
+                                          fontsize=9, va='top', family='monospace', animated=True) for _ in range(2))
+
+    canvas.draw()
+    renderer = canvas.get_renderer()
+    # the info box may overflow the text axes: its clean background is the whole column right of the map
+    text_clean = canvas.copy_from_bbox(Bbox.from_extents(ax_text.bbox.x0, 0, fig.bbox.x1, ax_text.bbox.y1))
+    second_box.set_text(f"Second: {frames.last_second}/{frames.last_second}")  # widest second line
+    second_clean = canvas.copy_from_bbox(second_box.get_window_extent(renderer).padded(1))
+    dot_pad = dot.get_markersize() * dpi / 72 + 2  # half-size of the pixels under the dot, with margin
+
+    if sink is None:
+        width, height = canvas.get_width_height()
+        sink = FFmpegSink(output_video, width, height, FPS, bitrate)
+
+    drawn, state_text, state_regions = 0, None, {}
+    try:
+        for i, second_text, text in zip(frames.indices.tolist(), frames.second_texts, frames.state_texts):
+            if i > drawn:
+                # the trail only grows: the new segments are drawn once, on top of the previous frame's trail
+                trail.set_segments(frames.segments[drawn:i])
+                trail.set_color(frames.colors[drawn:i])
+                ax_map.draw_artist(trail)
+                drawn = i
+
+            # text: the state lines are painted only when they change (from the cache of their pixels when the same
+            # lines were already drawn), the second line at every frame
+            if text != state_text:
+                canvas.restore_region(text_clean)
+                region = state_regions.get(text)
+                if region is None:
+                    state_box.set_text(text)
+                    ax_text.draw_artist(state_box)
+                    if len(state_regions) < STATE_CACHE_SIZE:
+                        state_regions[text] = canvas.copy_from_bbox(state_box.get_window_extent(renderer).padded(1))
+                else:
+                    canvas.restore_region(region)
+                state_text = text
+            else:
+                canvas.restore_region(second_clean)
+            second_box.set_text(second_text)
+            ax_text.draw_artist(second_box)
+
+            # the dot is drawn over a saved copy of the few pixels under it, put back after the frame
+            px, py = ax_map.transData.transform((xs[i], ys[i]))
+            under_dot = canvas.copy_from_bbox(Bbox.from_extents(px - dot_pad, py - dot_pad, px + dot_pad, py + dot_pad))
+            dot.set_data([xs[i]], [ys[i]])
+            ax_map.draw_artist(dot)
+            sink.write(canvas.buffer_rgba())
+            canvas.restore_region(under_dot)
+    finally:
+        sink.close()
+    return len(frames)
+
+
+if __name__ == "__main__":
+    # Render one session log; render_farm.py renders all the athlete × training × circuit combinations
+    parser = argparse.ArgumentParser(description="Video of a training session log")
+    parser.add_argument("log", help="session log (CSV or .npz)")
+    parser.add_argument("--out", help="output video (default: OUT_DIR/<log name>.mp4)")
+    parser.add_argument("--no-basemap", action="store_true")
+    parser.add_argument("--offline", action="store_true", help="basemap from the tile cache only")
+    parser.add_argument("--circuit", help="frame the whole circuit (the basemap seeded by tile_cache.py)")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.log))[0]
+    output_video = args.out or os.path.join(OUT_DIR, name + ".mp4")
+    os.makedirs(os.path.dirname(output_video) or ".", exist_ok=True)
+    n = render_video(load_log(args.log), name.replace("_", " – "), output_video, basemap=not args.no_basemap,
+                     tiles=TileCache(offline=True if args.offline else None),
+                     extent=circuit_extent(args.circuit) if args.circuit else None)
+    print(f"✅ Video saved: {output_video} ({n} frames)")
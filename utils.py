@@ -5,9 +5,9 @@ import csv
 from math import radians, cos, sin, asin, sqrt
 from runner_env import load_json
 import datetime
-from pyfiglet import Figlet
 
 def print_banner():
+    from pyfiglet import Figlet  # only for the banner
     f = Figlet(font='puffy')  # oppure 'standard', 'doom', '3d', ecc.
     print("════════════════════════════════════════════════════════════════════════")
     print(f.renderText('Smart Pacer'))             
@@ -86,8 +86,9 @@ def ask_mqtt():
         print("  ❌  MQTT disabled\n")
         return False
 
-def send_mqtt(state, action, reward, client, topic):
-    payload = json.dumps({
+def mqtt_payload(state, action, reward):
+    '''JSON message of a pacing step, as read by mqtt.py'''
+    return json.dumps({
         "second": state.get("segment_index", 0),
         "phase": state.get("phase_label", "unknown"),
         "fatigue": state.get("fatigue_level", "unknown"),
@@ -98,7 +99,9 @@ def send_mqtt(state, action, reward, client, topic):
         "timestamp": state["timestamp"],
         "slope": state.get("slope_level", "?")
     })
-    client.publish(topic, payload)
+
+def send_mqtt(state, action, reward, client, topic):
+    client.publish(topic, mqtt_payload(state, action, reward))
 
 def print_summary(profile_name, athlete, circuit, training_type, mqtt_enabled):
     print("\n" + "═" * 50)
@@ -125,14 +128,12 @@ def print_summary(profile_name, athlete, circuit, training_type, mqtt_enabled):
 def euclidean_distance(p1, p2):
     return math.sqrt(sum((p1[k] - p2[k])**2 for k in p1))
 
-def get_profile_label(athlete):
-    '''Load the correct q-table based on the athlete and training profile'''
-    base_profiles = load_json("data/athletes.json")
-    distances = {
-        label: euclidean_distance(athlete, base_profiles[label])
-        for label in base_profiles
-    }
-    return min(distances, key=distances.get)
+def get_profile_label(athlete, candidates=None):
+    '''Load the correct q-table based on the athlete and training profile: the nearest base profile, on standardised
+    features (see profile_index.py). candidates restricts the choice to some of the base profiles (e.g. the ones with
+    a trained q-table)'''
+    from profile_index import get_index  # numpy, only when matching
+    return get_index().nearest(athlete, candidates)
 
 def get_training_label(training_name):
     '''Load the correct q-table based on the training type'''
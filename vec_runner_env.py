@@ -0,0 +1,239 @@
+'''
+Batched version of RunnerEnv: steps N independent episodes of the same athlete / training / track at once.
+All the per-episode quantities (HR float, power zone, fatigue score, time spent in high zones, ...) are kept in NumPy arrays
+and the transition + reward logic of RunnerEnv is applied as array operations, with the random noise drawn in bulk.
+The dynamics are the same of the scalar environment, so the episode statistics match (within noise) the ones of RunnerEnv.
+
+Since every episode of the batch has the same training plan and duration, all the episodes advance in lockstep:
+the clock (and so the phase and the targets of the plan) is shared, while the physiological state, the distance run
+and so the position on the track (and its slope) are per episode.
+States are returned as integer codes: zones are 1..5, while fatigue level, phase and slope
+are indexes into FATIGUE_LEVELS, PHASES and SLOPES.
+'''
+
+import time
+import random
+
+import numpy as np
+
+from runner_env import RunnerEnv, load_json, ACTIONS, PHASES, SLOPES
+from training_plan import compile_plan
+from track_store import track_from_points
+from athlete_kernel import compile_kernel, SLOW_DOWN
+
+# Phase indexes, same order of PHASES
+WARMUP, PUSH, RECOVER, COOLDOWN = 0, 1, 2, 3
+
+
+class VecRunnerEnv:
+    def __init__(self, athlete_profile, training_plan, track_data=None, num_envs=1024, seed=None):
+        self.athlete = athlete_profile
+        self.training = training_plan
+        self.tracking = track_data or []
+        if self.tracking and not hasattr(self.tracking, "indexes_at"):
+            self.tracking = track_from_points(self.tracking)
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+        self.training_type = self.training.get("name", "generic").lower()
+        self.total_steps = self.training["duration"] * 60
+        self._compile_athlete()
+        self._compile_plan()
+        # Like RunnerEnv._prev_in_zone, this is not cleared by reset()
+        self.prev_in_zone = np.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def _compile_athlete(self):
+        ''' Array versions of the precompiled athlete kernel tables used by the fatigue and reward updates.'''
+        k = self.kernel = compile_kernel(self.athlete, self.training_type, self.total_steps)
+        self.warmup_gain = np.array(k.warmup_gain)
+        self.push_gain = np.array(k.push_gain)
+        self.zone_reward = np.array(k.zone_reward)
+        self.coherence_bonus = np.array(k.coherence_bonus)
+        self.capacity_adj = np.array(k.capacity_adj)
+        # Tables are read with take(), much cheaper than fancy indexing: 2-D tables are flattened
+        #   phase_bonus[phase]: action * 3 + HR below / on / above target, slope_penalty: slope * 3 + action
+        self.phase_bonus = np.array([k.phase_bonus[phase] for phase in PHASES]).reshape(len(PHASES), -1)
+        self.slope_penalty = np.array([k.slope_penalty[slope] for slope in SLOPES]).ravel()
+        self.speed_by_zone = np.array(k.speed_by_zone)
+
+    def _compile_plan(self):
+        ''' Turn the training plan into per-second arrays of phase and target codes.
+        After the end of the plan the last segment is kept, like RunnerEnv does.'''
+        plan = compile_plan(self.training)
+        last_second = 2 * ((self.total_steps + 1) // 2)
+        idx = np.minimum(np.arange(last_second + 1), plan.length - 1)
+
+        def per_second(values):
+            return np.repeat(np.array(values, dtype=np.int8), plan.durations)[idx]
+
+        self.phase_by_second = per_second([PHASES.index(phase) for phase, _, _ in plan.runs])
+        self.target_hr_by_second = per_second([int(hr[1:]) for _, hr, _ in plan.runs])
+        self.target_power_by_second = per_second([int(power[1:]) for _, _, power in plan.runs])
+
+        # Track slopes, looked up by the distance run by every episode
+        self.track_slope = np.asarray(self.tracking.slope) if self.tracking else None
+
+    def reset(self):
+        n = self.num_envs
+        self.second = 0
+        self.fatigue_score = np.zeros(n)
+        self.time_in_high_zones = np.zeros(n, dtype=np.int64)
+        self.hr_float = np.ones(n)
+        self.hr_zone = np.ones(n, dtype=np.int8)
+        self.power_zone = np.ones(n, dtype=np.int8)
+        self.fatigue_level = np.zeros(n, dtype=np.int8)
+        self.distance = np.zeros(n)
+        self.track_index = np.zeros(n, dtype=np.int64)
+        self.slope = self._slope_at(self.track_index)
+        return self._get_state()
+
+    def step(self, actions):
+        ''' Advance every episode of one step. `actions` is an array (or a single value for all the episodes)
+        of action indexes into ACTIONS. Returns the batched state, the array of rewards and the (shared) done flag.'''
+        actions = np.broadcast_to(np.asarray(actions, dtype=np.int8), (self.num_envs,))
+        phase = self.phase_by_second[self.second]
+
+        self._update_power_zone(actions)
+        self._update_hr_zone()
+        self._update_fatigue(actions, phase)
+
+        # Like RunnerEnv, the clock moves twice per step (step + _advance_segment)
+        self.second += 2
+        self._advance_position(2)
+
+        reward = self._compute_reward(actions)
+        done = self.second >= self.total_steps
+        return self._get_state(), reward, done
+
+    def _advance_position(self, seconds):
+        self.distance += self.speed_by_zone.take(self.power_zone) * seconds
+        if self.track_slope is not None:
+            self.track_index = self.tracking.indexes_at(self.distance)
+        self.slope = self._slope_at(self.track_index)
+
+    def _slope_at(self, index):
+        if self.track_slope is None:
+            return np.zeros(self.num_envs, dtype=np.int8)
+        return self.track_slope.take(index)
+
+    def _update_power_zone(self, actions):
+        self.power_zone = np.clip(self.power_zone + (actions - 1), 1, 5).astype(np.int8)
+
+    def _update_hr_zone(self):
+        self.hr_float = np.clip(self.hr_float + (self.power_zone - self.hr_float) * 0.2, 1.0, 5.0)
+        self.hr_zone = np.rint(self.hr_float).astype(np.int8)
+
+    def _update_fatigue(self, actions, phase):
+        k = self.kernel
+        hr = self.hr_zone
+        if phase == RECOVER or phase == COOLDOWN:
+            f = self.fatigue_score
+            sig = 1 / (1 + np.exp(-10 * (f - 5)))
+            self.fatigue_score = np.maximum(k.fatigue_floor, f * k.recovery_decay - k.recovery_rate * sig)
+        else:
+            high_hr = hr >= 4
+            gain = (self.push_gain if phase == PUSH else self.warmup_gain).take(hr)
+            gain -= 0.1 * ((hr <= 2) & (actions == SLOW_DOWN))
+
+            self.time_in_high_zones = np.where(high_hr, self.time_in_high_zones + 1,
+                                               np.maximum(0, self.time_in_high_zones - 1))
+            gain += k.high_zone_penalty * self.time_in_high_zones
+            gain = np.where(high_hr & (self.power_zone >= 4), gain * k.combined_factor, gain)
+            gain *= k.gain_scale
+
+            noise = self.rng.uniform(-0.02, 0.02, self.num_envs)
+            self.fatigue_score = np.clip(self.fatigue_score + gain + noise, 0, 10)
+
+        self.fatigue_level = ((self.fatigue_score > k.medium_threshold).astype(np.int8)
+                              + (self.fatigue_score > k.high_threshold))
+
+    def _compute_reward(self, actions):
+        k = self.kernel
+        hr = self.hr_zone
+        power = self.power_zone
+        target_hr = self.target_hr_by_second[self.second]
+        target_power = self.target_power_by_second[self.second]
+        phase = self.phase_by_second[self.second]
+        fat = self.fatigue_score
+
+        # Zone Matching Reward
+        hr_diff = np.abs(hr - target_hr)
+        power_diff = np.abs(power - target_power)
+
+        # Fatigue penalty
+        fatigue_penalty = np.where(
+            fat <= k.low_penalty, 0.0,
+            np.where(fat <= k.medium_penalty,
+                     -1.0 * (fat - k.low_penalty),
+                     -2.0 * (fat - k.medium_penalty)))
+
+        # Phase-specific bonuses, by action and HR zone below / on / above the target
+        phase_bonus = self.phase_bonus[phase].take(3 * actions + np.sign(hr - target_hr) + 1)
+
+        # Dynamic funnel bonus
+        tol = 1 if self.second < k.half_session else 0
+        in_zone = (hr_diff <= tol) & (power_diff <= tol)
+        funnel_bonus = np.where(in_zone, np.where(self.prev_in_zone, 0.5, 2.0), 0.0)
+        self.prev_in_zone = in_zone
+
+        total = (self.zone_reward.take(hr_diff) + self.zone_reward.take(power_diff) +
+                 self.coherence_bonus.take(np.abs(hr - power)) + phase_bonus +
+                 fatigue_penalty + self.capacity_adj.take(hr) +
+                 self.slope_penalty.take(3 * self.slope + actions) + funnel_bonus)
+        total *= 1.0 - np.minimum(fat / 200.0, 0.4)
+        return total + self.rng.uniform(-0.1, 0.1, self.num_envs)
+
+    def _get_state(self):
+        n = self.num_envs
+        s = min(self.second, len(self.phase_by_second) - 1)
+        return {
+            "HR_zone": self.hr_zone,
+            "power_zone": self.power_zone,
+            "fatigue_level": self.fatigue_level,
+            "segment_index": self.second,
+            "phase_label": np.full(n, self.phase_by_second[s], dtype=np.int8),
+            "target_hr_zone": np.full(n, self.target_hr_by_second[s], dtype=np.int8),
+            "target_power_zone": np.full(n, self.target_power_by_second[s], dtype=np.int8),
+            "slope_level": self.slope,
+        }
+
+
+if __name__ == "__main__":
+    # Sanity check: compare the episode statistics and the throughput of the scalar and the batched environment
+    # under the same uniform random policy.
+    athlete = load_json("data/athletes.json")["runner"]
+    training = load_json("data/trainings.json")["fartlek"]
+    track = load_json("data/maps/Parco acquedotti (Roma).json")
+    n_scalar, n_batch = 50, 4096
+
+    env = RunnerEnv(athlete, training, track_data=track, verbose=False)
+    scalar_rewards, scalar_high = [], []
+    steps, t0 = 0, time.perf_counter()
+    for _ in range(n_scalar):
+        env.reset()
+        done, total, high = False, 0.0, 0
+        while not done:
+            state, r, done = env.step(random.choice(ACTIONS))
+            total += r
+            high += state["fatigue_level"] == "high"
+            steps += 1
+        scalar_rewards.append(total)
+        scalar_high.append(high)
+    scalar_sps = steps / (time.perf_counter() - t0)
+
+    vec = VecRunnerEnv(athlete, training, track_data=track, num_envs=n_batch, seed=0)
+    vec.reset()
+    done, total, high = False, np.zeros(n_batch), np.zeros(n_batch)
+    steps, t0 = 0, time.perf_counter()
+    while not done:
+        state, r, done = vec.step(vec.rng.integers(0, len(ACTIONS), n_batch))
+        total += r
+        high += state["fatigue_level"] == 2
+        steps += n_batch
+    vec_sps = steps / (time.perf_counter() - t0)
+
+    print(f"RunnerEnv    : reward {np.mean(scalar_rewards):8.1f} ± {np.std(scalar_rewards):6.1f} | "
+          f"high fatigue steps {np.mean(scalar_high):7.1f} | {scalar_sps:12,.0f} steps/s")
+    print(f"VecRunnerEnv : reward {total.mean():8.1f} ± {total.std():6.1f} | "
+          f"high fatigue steps {high.mean():7.1f} | {vec_sps:12,.0f} steps/s")
+    print(f"🚀 Speedup: x{vec_sps / scalar_sps:.0f}")